@@ -47,7 +47,8 @@ async def check_migration_status():
     """Check how many users need migration"""
     from database.mongo import users_collection
     
-    total_users = await users_collection.count_documents({})
+    # Unfiltered total comes from collection metadata - no scan
+    total_users = await users_collection.estimated_document_count()
     old_structure_users = await users_collection.count_documents({
         "$or": [
             {"followers": {"$exists": True}},
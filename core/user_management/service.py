@@ -2,6 +2,7 @@
 User Management Service - Unified helpers and data operations
 Combines UserDataService, user_helper, and auth_helper functionality
 """
+import asyncio
 from database.mongo import (
     users_collection,
     user_social_collection, 
@@ -159,41 +160,47 @@ class UserDataService:
     
     @staticmethod
     async def init_user_data(user_id: ObjectId):
-        """Khởi tạo data cho user mới - ✅ Uses ObjectId"""
-        # Tạo social data
-        await user_social_collection.insert_one({
-            "user_id": user_id,  # ✅ ObjectId
-            "followers": [],
-            "following": [],
-            "follower_count": 0,
-            "following_count": 0
-        })
-        
-        # Tạo activity data
-        await user_activity_collection.insert_one({
-            "user_id": user_id,  # ✅ ObjectId
-            "favorite_dishes": [],
-            "cooked_dishes": [],
-            "viewed_dishes": [],
-            "created_recipes": [],
-            "created_dishes": []
-        })
-        
-        # Tạo notifications data
-        await user_notifications_collection.insert_one({
-            "user_id": user_id,  # ✅ ObjectId
-            "notifications": [],
-            "unread_count": 0
-        })
-        
-        # Tạo preferences data
-        await user_preferences_collection.insert_one({
-            "user_id": user_id,  # ✅ ObjectId
-            "reminders": [],
-            "dietary_restrictions": [],
-            "cuisine_preferences": [],
-            "difficulty_preference": "all"
-        })
+        """Khởi tạo data cho user mới - ✅ Uses ObjectId
+        The four sub-docs live in different collections, so the writes run concurrently (one RTT)
+        Upsert + $setOnInsert keeps this idempotent: re-running it (e.g. from add_to_cooked)
+        never duplicates or overwrites a user's existing sub-docs"""
+        defaults = (
+            # Tạo social data
+            (user_social_collection, {
+                "followers": [],
+                "following": [],
+                "follower_count": 0,
+                "following_count": 0
+            }),
+            # Tạo activity data
+            (user_activity_collection, {
+                "favorite_dishes": [],
+                "cooked_dishes": [],
+                "viewed_dishes": [],
+                "created_recipes": [],
+                "created_dishes": []
+            }),
+            # Tạo notifications data
+            (user_notifications_collection, {
+                "notifications": [],
+                "unread_count": 0
+            }),
+            # Tạo preferences data
+            (user_preferences_collection, {
+                "reminders": [],
+                "dietary_restrictions": [],
+                "cuisine_preferences": [],
+                "difficulty_preference": "all"
+            }),
+        )
+        await asyncio.gather(*(
+            collection.update_one(
+                {"user_id": user_id},  # ✅ ObjectId
+                {"$setOnInsert": fields},
+                upsert=True
+            )
+            for collection, fields in defaults
+        ))
     
     @staticmethod
     async def add_to_cooked(user_id: ObjectId, dish_id: str, max_history: int = 50):
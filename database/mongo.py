@@ -3,6 +3,7 @@
 import motor.motor_asyncio
 import os
 from dotenv import load_dotenv
+from pymongo import ReadPreference
 
 load_dotenv()
 
@@ -10,11 +11,23 @@ load_dotenv()
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DATABASE_NAME", "cook_app")
 
-# ASYNC MongoDB client (Motor) - consistent with main_async.py
+# Connection pool sizing - tune to expected concurrent requests x average query latency
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "200"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "20"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "30000"))
+# Fail fast when the pool is exhausted (e.g. admin fan-out jobs) instead of queueing indefinitely
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+
+# ASYNC MongoDB client (Motor) - shared with main_async.py
 client = motor.motor_asyncio.AsyncIOMotorClient(
     MONGODB_URI,
     tls=True,
     serverSelectionTimeoutMS=30000,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    retryWrites=True,
 )
 db = client[DB_NAME]
 
@@ -25,6 +38,12 @@ users_collection = db["users"]
 dishes_collection = db["dishes"]
 comments_collection = db["comments"]  # Added for comments
 
+# Read-only view for public, cache-tolerant listings - may be served by secondaries
+# (keep using dishes_collection for anything that must read its own writes)
+dishes_read_collection = dishes_collection.with_options(
+    read_preference=ReadPreference.SECONDARY_PREFERRED
+)
+
 # User-related collections (ALL ASYNC)
 user_social_collection = db["user_social"]  # followers, following
 user_activity_collection = db["user_activity"]  # favorites, cooked, viewed
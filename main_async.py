@@ -3,14 +3,14 @@ DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
 from fastapi import APIRouter, FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from typing import Optional, Dict, Any
 from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
 import firebase_admin
 from firebase_admin import auth as fb_auth, credentials
 from datetime import datetime, timezone, timedelta
-import motor.motor_asyncio
 import logging
 from bson import ObjectId
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
@@ -47,17 +47,8 @@ if not firebase_admin._apps:
             print("✅ Firebase initialized with ApplicationDefault")
 
 # ==== Init MongoDB (ASYNC ONLY) ====
-MONGODB_URI = os.getenv("MONGODB_URI")
-DB_NAME = os.getenv("DATABASE_NAME", "cook_app")
-
-# ASYNC MongoDB client (Motor)
-client = motor.motor_asyncio.AsyncIOMotorClient(
-    MONGODB_URI,
-    tls=True,
-    serverSelectionTimeoutMS=30000,
-)
-
-db = client[DB_NAME]
+# ✅ Reuse the shared Motor client from database.mongo - one connection pool per process
+from database.mongo import client, db
 
 # ASYNC collections
 users_col = db["users"]
@@ -70,15 +61,52 @@ user_preferences_col = db["user_preferences"]
 # ==== Redis Setup ====
 redis_client = None
 
+class InMemoryPipeline:
+    """Buffers commands and runs them in order on execute() - mirrors redis-py's pipeline API"""
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+    
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+    
+    async def execute(self):
+        commands, self.commands = self.commands, []
+        return [await method(*args, **kwargs) for method, args, kwargs in commands]
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        self.commands = []
+
 class InMemoryRedis:
     """Simple in-memory Redis mock for development"""
     def __init__(self):
         self.data = {}
         self.expiry = {}
     
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+    
     async def ping(self):
         return True
     
+    async def set(self, key, value, ex=None, nx=False):
+        import time
+        if nx and await self.get(key) is not None:
+            return None
+        self.data[key] = value
+        if ex is not None:
+            self.expiry[key] = time.time() + ex
+        else:
+            self.expiry.pop(key, None)
+        return True
+    
     async def setex(self, key, seconds, value):
         import time
         self.data[key] = value
@@ -111,6 +139,50 @@ class InMemoryRedis:
             new_val = int(current) + 1
             self.data[key] = str(new_val)
             return new_val
+    
+    async def expire(self, key, seconds):
+        import time
+        if key not in self.data:
+            return False
+        self.expiry[key] = time.time() + seconds
+        return True
+    
+    async def hset(self, key, mapping):
+        current = await self.get(key)
+        if current is None:
+            current = self.data[key] = {}
+        current.update({k: str(v) for k, v in mapping.items()})
+        return len(mapping)
+    
+    async def hgetall(self, key):
+        return dict(await self.get(key) or {})
+    
+    async def token_bucket(self, key, capacity, refill_rate, now):
+        """Python equivalent of otp_route.TOKEN_BUCKET_LUA (no Lua scripting in memory)"""
+        import math
+        bucket = await self.get(key) or {}
+        tokens = float(bucket.get("tokens", capacity))
+        ts = float(bucket.get("ts", now))
+        tokens = min(capacity, tokens + max(0, now - ts) * refill_rate)
+        allowed = 0
+        if tokens >= 1:
+            tokens -= 1
+            allowed = 1
+        await self.hset(key, mapping={"tokens": tokens, "ts": now})
+        await self.expire(key, math.ceil(capacity / refill_rate))
+        return [allowed, math.floor(tokens)]
+    
+    async def hmget(self, key, *fields):
+        current = await self.get(key) or {}
+        return [current.get(field) for field in fields]
+    
+    async def hincrby(self, key, field, amount=1):
+        current = await self.get(key)
+        if current is None:
+            current = self.data[key] = {}
+        new_val = int(current.get(field, 0)) + amount
+        current[field] = str(new_val)
+        return new_val
 
 async def init_redis():
     """Initialize Redis connection"""
@@ -148,7 +220,8 @@ async def init_redis():
     return redis_client
 
 # ==== FastAPI app ====
-app = FastAPI()
+# ✅ orjson for response serialization (native datetime support, much faster than stdlib json)
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # ==== Health Check Endpoint ====
 @app.api_route("/", methods=["GET", "HEAD"])
@@ -197,7 +270,7 @@ async def auto_cleanup_deleted_dishes():
         comments_collection = db["comments"]
         recipe_collection = db["recipes"]
         
-        import cloudinary
+        from routes.dish_route import _extract_cloudinary_public_id, _destroy_cloudinary_image
         
         CLOUDINARY_ENABLED = os.getenv("CLOUDINARY_ENABLED", "false").lower() == "true"
         
@@ -226,19 +299,10 @@ async def auto_cleanup_deleted_dishes():
                 # Delete Cloudinary image
                 if CLOUDINARY_ENABLED and dish.get("image_url"):
                     try:
-                        public_id = dish.get("public_id")
-                        if not public_id and dish.get("image_url"):
-                            # Extract from URL
-                            url_parts = dish["image_url"].split("/upload/")
-                            if len(url_parts) > 1:
-                                path_with_version = url_parts[1]
-                                path_parts = path_with_version.split("/")
-                                if len(path_parts) > 1:
-                                    filename_with_ext = "/".join(path_parts[1:])
-                                    public_id = filename_with_ext.rsplit(".", 1)[0]
+                        public_id = _extract_cloudinary_public_id(dish)
                         
                         if public_id:
-                            cloudinary.uploader.destroy(public_id)
+                            await _destroy_cloudinary_image(public_id)
                             cleanup_stats["images_deleted"] += 1
                     except Exception as e:
                         logging.error(f"Failed to delete Cloudinary image for dish {dish_id}: {e}")
@@ -271,6 +335,18 @@ async def startup_event():
     """Initialize services on startup"""
     await init_redis()
     
+    # Ensure indexes used by hot query paths
+    from routes.dish_route import ensure_dish_indexes
+    from routes.recommendation_route import ensure_recommendation_indexes
+    from routes.otp_route import ensure_otp_indexes
+    from utils.recipe_handlers import ensure_recipe_indexes
+    from utils.user_handlers import ensure_user_indexes
+    await ensure_dish_indexes()
+    await ensure_recommendation_indexes()
+    await ensure_otp_indexes()
+    await ensure_recipe_indexes()
+    await ensure_user_indexes()
+    
     # Don't run cleanup on startup to avoid blocking requests
     # Scheduler will handle it at scheduled time (2:00 AM daily)
     
@@ -284,6 +360,15 @@ async def startup_event():
             name="Cleanup dishes deleted >7 days ago",
             replace_existing=True
         )
+        # Retry Cloudinary deletions whose background task didn't complete
+        from routes.dish_route import retry_pending_cloudinary_deletes
+        scheduler.add_job(
+            retry_pending_cloudinary_deletes,
+            CronTrigger(minute="*/15"),  # every 15 minutes
+            id="retry_pending_cloudinary_deletes",
+            name="Retry pending Cloudinary image deletions",
+            replace_existing=True
+        )
         scheduler.start()
         logging.info("✅ Background scheduler started - Daily cleanup at 2:00 AM")
     
@@ -295,6 +380,10 @@ async def shutdown_event():
     if scheduler.running:
         scheduler.shutdown()
         logging.info("🛑 Background scheduler stopped")
+    
+    # Close the shared Cloudinary HTTP client
+    from routes.dish_route import _cloudinary_http
+    await _cloudinary_http.aclose()
 
 # Include các routers từ routes
 from routes import user_route, dish_route, recipe_route, search_route, comment_route, otp_route
@@ -335,6 +424,9 @@ def is_allowed_origin(origin: str) -> bool:
         return True
     return False
 
+# ✅ Compress JSON responses (list/feed payloads shrink ~5-10x); tiny bodies are left as-is
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origin_regex=r"https://.*\.2025-27-09-app-cook-frontend\.pages\.dev",
@@ -499,7 +591,7 @@ async def update_profile(payload: Dict[str, Any], decoded=Depends(get_current_us
 async def general_exception_handler(request, exc):
     logger.exception("Unhandled error")  # vẫn log full stacktrace
     detail = str(exc) if os.getenv("DEBUG","False").lower() == "true" else "Internal server error"
-    return JSONResponse(status_code=500, content={"detail": detail})
+    return ORJSONResponse(status_code=500, content={"detail": detail})
 
 
 # ==== ASYNC Admin endpoints ====
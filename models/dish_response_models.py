@@ -15,9 +15,15 @@ class DishDetailOut(BaseModel):
     difficulty: Optional[str] = None
     created_at: Optional[datetime] = None
 
+class DishFullDetailOut(DishDetailOut):
+    favorite_count: int = 0
+    comment_count: int = 0
+
 class RecipeDetailOut(BaseModel):
     id: str
     name: str
+    description: str = ""
+    ingredients: List[str] = []
     instructions: List[str] = []
     cooking_time: int = 0
     difficulty: Optional[str] = None
@@ -26,6 +32,8 @@ class RecipeDetailOut(BaseModel):
     created_by: Optional[str] = None
     dish_id: Optional[str] = None
     ratings: list = []
+    average_rating: float = 0.0
+    image_url: Optional[str] = None
     created_at: Optional[datetime] = None
 
 class DishWithRecipeDetailOut(BaseModel):
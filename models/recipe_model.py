@@ -7,6 +7,10 @@ class RatingRequest(BaseModel):
     """Model for rating recipe requests"""
     rating: int = Field(..., ge=1, le=5, description="Rating must be between 1 and 5 stars")
 
+class BulkRatingRequest(BaseModel):
+    """Model for rating several recipes at once - {recipe_id: rating}"""
+    ratings: Dict[str, int] = Field(..., description="Map of recipe ID to a 1-5 star rating")
+
 class RecipeIn(BaseModel):
     name: str
     description: Optional[str] = ""
@@ -62,6 +66,20 @@ class Recipe(BaseModel):
             }
         }
 
+class RecipeListItemOut(BaseModel):
+    """List shape - no ingredients/instructions; fetch /recipes/{id} for the full recipe"""
+    id: str = Field(alias="_id")
+    name: str
+    description: Optional[str]
+    difficulty: str
+    image_url: Optional[str]
+    dish_id: str
+    created_by: str
+    average_rating: Optional[float] = 0.0
+
+    class Config:
+        validate_by_name = True
+
 class RecipeOut(BaseModel):
     id: str = Field(alias="_id")
     name: str
@@ -1,30 +1,48 @@
 # routers/dishes.py - FIXED VERSION
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from models.dish_model import Dish, DishOut, DishIn
 from models.dish_with_recipe_model import DishWithRecipeIn, DishWithRecipeOut
-from models.dish_response_models import DishDetailOut, DishWithRecipeDetailOut, RecipeDetailOut
-from database.mongo import dishes_collection, users_collection, recipe_collection, comments_collection, user_activity_collection
+from models.dish_response_models import DishDetailOut, DishFullDetailOut, DishWithRecipeDetailOut
+from database.mongo import client as mongo_client, db, dishes_collection, dishes_read_collection, users_collection, recipe_collection, comments_collection, user_activity_collection
 
 # ✅ Alias for consistency
 user_activity_col = user_activity_collection
 recipes_collection = recipe_collection
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.write_concern import WriteConcern
+from pymongo.errors import CollectionInvalid
 from datetime import datetime, timezone, timedelta
 from core.auth.dependencies import get_current_user, get_user_by_email, extract_user_email
-from typing import List, Optional, Dict
-from pydantic import BaseModel
+from utils.user_handlers import invalidate_dish_meta
+from utils.recipe_handlers import invalidate_recipe_detail
+from typing import List, Optional, Dict, Annotated, Any, Awaitable, Callable, Tuple
+from pydantic import BaseModel, AfterValidator
 import cloudinary
-import cloudinary.uploader
 from cloudinary.utils import cloudinary_url
 import os
 from dotenv import load_dotenv
 import base64
 import io
+import re
 import logging
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+import orjson
+import hashlib
+import time
+import httpx
 load_dotenv()
 
 # ✅ Import is_admin from user_handlers
 from utils.user_handlers import is_admin 
+from utils.ttl_cache import TTLCache
+import random
+
+logger = logging.getLogger(__name__)
 
 # ✅ Safer Cloudinary configuration - check at startup, not import
 def _configure_cloudinary():
@@ -36,7 +54,7 @@ def _configure_cloudinary():
     if not all([CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET]):
         # In development, log warning but don't crash
         if os.getenv("DEBUG", "False").lower() == "true":
-            logging.warning("Cloudinary credentials not set. Image upload will be disabled.")
+            logger.warning("Cloudinary credentials not set. Image upload will be disabled.")
             return False
         else:
             raise ValueError("Missing Cloudinary credentials. Please set CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, and CLOUDINARY_API_SECRET in your environment variables.")
@@ -48,55 +66,224 @@ def _configure_cloudinary():
         secure=True
     )
     
-    logging.info("Cloudinary configured successfully")
+    logger.info("Cloudinary configured successfully")
     return True
 
 # Configure at module load
 CLOUDINARY_ENABLED = _configure_cloudinary()
 
+MAX_IMAGE_BYTES = 10 * 1024 * 1024  # 10MB upload limit
+
+# ✅ Shared async HTTP client for Cloudinary uploads/deletes (reuses TCP/TLS connections)
+_cloudinary_http = httpx.AsyncClient(http2=True, timeout=60.0)
+CLOUDINARY_UPLOAD_TRANSFORMATION = "q_auto:good/f_auto"
+
+def _cloudinary_signed_params(params: Dict[str, str]) -> Dict[str, str]:
+    """
+    Add timestamp, api_key and signature to a Cloudinary API call
+    Signature = sha1 of the alphabetically sorted signed params + api_secret
+    """
+    config = cloudinary.config()
+    signed = {**params, "timestamp": str(int(time.time()))}
+    to_sign = "&".join(f"{k}={signed[k]}" for k in sorted(signed))
+    signed["signature"] = hashlib.sha1(f"{to_sign}{config.api_secret}".encode()).hexdigest()
+    signed["api_key"] = config.api_key
+    return signed
+
+async def _cloudinary_upload(image_data: bytes, folder: str) -> dict:
+    """
+    Signed upload straight to Cloudinary's REST endpoint without blocking the event loop
+    (cloudinary.uploader.upload is synchronous)
+    """
+    response = await _cloudinary_http.post(
+        f"https://api.cloudinary.com/v1_1/{cloudinary.config().cloud_name}/image/upload",
+        files={"file": image_data},
+        data=_cloudinary_signed_params({"folder": folder, "transformation": CLOUDINARY_UPLOAD_TRANSFORMATION}),
+    )
+    response.raise_for_status()
+    return response.json()
+
+async def _cloudinary_destroy(public_id: str) -> dict:
+    """
+    Signed destroy via the REST endpoint - same call cloudinary.uploader.destroy makes,
+    but on the shared async client instead of a worker thread
+    """
+    response = await _cloudinary_http.post(
+        f"https://api.cloudinary.com/v1_1/{cloudinary.config().cloud_name}/image/destroy",
+        data=_cloudinary_signed_params({"public_id": public_id}),
+    )
+    response.raise_for_status()
+    return response.json()
+
+# ✅ Short-lived caches for public list endpoints (shared data, changes rarely)
+_dish_list_cache = TTLCache(ttl=60, maxsize=128)      # keyed on endpoint + query params
+_random_pool_cache = TTLCache(ttl=300, maxsize=1)     # candidate _ids for /random
+RANDOM_POOL_SIZE = 500
+
+# ✅ Per-dish response caches for the public detail endpoints
+_dish_detail_cache = TTLCache(ttl=30, maxsize=10_000)       # dish_id -> DishDetailOut-shaped dict
+_dish_recipe_cache = TTLCache(ttl=30, maxsize=10_000)       # dish_id -> DishWithRecipeDetailOut JSON dict
+_dish_not_found_cache = TTLCache(ttl=5, maxsize=10_000)     # dish_id -> True (absorbs 404 probes)
+
+def _invalidate_dish_cache(dish_id: str):
+    """Drop cached detail responses for a dish after it is modified"""
+    _dish_detail_cache.pop(dish_id)
+    _dish_recipe_cache.pop(dish_id)
+    _dish_not_found_cache.pop(dish_id)
+    invalidate_dish_meta(dish_id)  # View-history name/image cache (utils.user_handlers)
+
 router = APIRouter()
 
-class RecipeDetailOut(BaseModel):
-    id: str
-    name: str
-    description: str = ""
-    ingredients: list = []
-    difficulty: str = ""
-    instructions: list = []
-    average_rating: float = 0.0
-    image_url: str = None
-    created_by: str = None
-    dish_id: str = None
-    ratings: list = []
-    created_at: datetime = None
+# ✅ Audit trail - unacknowledged (w=0) inserts, the handler never waits on them
+AUDIT_LOG_MAX_BYTES = 100 * 1024 * 1024
+audit_logs_collection = db["audit_logs"].with_options(write_concern=WriteConcern(w=0))
+_audit_tasks = set()  # Strong refs so pending inserts aren't garbage collected
+
+def _emit_audit_log(entry: dict):
+    """Fire-and-forget insert into audit_logs"""
+    task = asyncio.create_task(audit_logs_collection.insert_one(entry))
+    _audit_tasks.add(task)
+    task.add_done_callback(_audit_tasks.discard)
+
+async def ensure_dish_indexes():
+    """
+    Create necessary indexes for dishes collection
+    Each create_index runs independently - one failure doesn't skip the rest or the audit_logs setup
+    Set SKIP_INDEX_ENSURE=1 where indexes are provisioned by migration
+    """
+    if os.getenv("SKIP_INDEX_ENSURE") == "1":
+        return
+    
+    index_specs = [
+        # Name index for the anchored prefix search in get_my_dishes
+        (dishes_collection, "name", {}),
+        # Trash listing / scheduled cleanup - only soft-deleted dishes are indexed
+        (dishes_collection, "deleted_at", {
+            "partialFilterExpression": {"deleted_at": {"$exists": True}},
+        }),
+        # Indexes for the cleanup queries run when a dish is deleted
+        (users_collection, "favorite_dishes", {}),
+        (user_activity_collection, "target_id", {}),
+        (user_activity_collection, "viewed_dishes_and_users.id", {}),
+        (comments_collection, [("dish_id", 1), ("deleted_at", 1)], {}),
+        (recipe_collection, "dish_id", {}),
+    ]
+    results = await asyncio.gather(
+        *(col.create_index(keys, **options) for col, keys, options in index_specs),
+        return_exceptions=True
+    )
+    
+    failed = False
+    for (col, keys, _), result in zip(index_specs, results):
+        if isinstance(result, Exception):
+            failed = True
+            logger.warning("⚠️ Dish index %s.%s creation failed (may already exist): %s", col.name, keys, result)
+    
+    # Capped audit trail - oldest entries roll off once the size cap is reached
+    try:
+        await db.create_collection("audit_logs", capped=True, size=AUDIT_LOG_MAX_BYTES)
+    except CollectionInvalid:
+        pass  # Already exists
+    except Exception as e:
+        failed = True
+        logger.warning("⚠️ audit_logs capped collection setup failed: %s", e)
+    
+    if not failed:
+        logger.info("✅ Dish indexes created successfully")
 
 class CheckFavoritesRequest(BaseModel):
     dish_ids: List[str]
 
+# Document fields read by _to_detail_dict, in unpacking order
+_DETAIL_FIELDS = (
+    "_id", "name", "image_url", "cooking_time", "average_rating", "ingredients",
+    "liked_by", "creator_id", "recipe_id", "difficulty", "created_at",
+)
+
+def _to_detail_dict(d) -> dict:
+    """
+    Convert MongoDB document to a DishDetailOut-shaped dict with consistent field mapping
+    ✅ Single map(d.get, ...) pass instead of one Python-level .get() per field
+    """
+    (_id, name, image_url, cooking_time, average_rating, ingredients,
+     liked_by, creator_id, recipe_id, difficulty, created_at) = map(d.get, _DETAIL_FIELDS)
+    return {
+        "id": str(_id),
+        "name": name if name is not None else "",
+        "image_url": image_url,
+        "cooking_time": int(cooking_time or 0),
+        "average_rating": float(average_rating or 0.0),
+        "ingredients": ingredients or [],
+        "liked_by": liked_by or [],
+        "creator_id": str(creator_id) if creator_id is not None else None,
+        "recipe_id": str(recipe_id) if recipe_id is not None else None,
+        "difficulty": difficulty,
+        "created_at": created_at,
+    }
+
 def _to_detail_out(d) -> DishDetailOut:
-    """Convert MongoDB document to DishDetailOut with consistent field mapping"""
-    return DishDetailOut(
-        id=str(d["_id"]),
-        name=d.get("name", ""),
-        image_url=d.get("image_url"),
-        cooking_time=int(d.get("cooking_time") or 0),
-        average_rating=float(d.get("average_rating") or 0.0),
-        ingredients=d.get("ingredients") or [],
-        liked_by=d.get("liked_by") or [],
-        creator_id=d.get("creator_id"),
-        recipe_id=d.get("recipe_id"),
-        difficulty=d.get("difficulty"),
-        created_at=d.get("created_at"),
-    )
+    """
+    Convert MongoDB document to DishDetailOut
+    ✅ Uses model_construct: documents come from our own collection and the
+    fields are coerced in _to_detail_dict, so Pydantic validation is skipped
+    """
+    return DishDetailOut.model_construct(**_to_detail_dict(d))
+
+# ✅ Related-count stages for /{dish_id}/full - built once, only the $match is per request
+# Both lookups use localField/foreignField so they hit the users.favorite_dishes and
+# comments (dish_id, deleted_at) indexes; the inner pipeline reduces each join to a count
+# _dish_refs is [string id, ObjectId]: an array localField matches either stored form (same rule as _dish_refs())
+# ⚠️ localField/foreignField combined with "pipeline" requires MongoDB 5.0+
+_DISH_COUNTS_STAGES = [
+    {"$limit": 1},
+    {"$addFields": {"_dish_refs": [{"$toString": "$_id"}, "$_id"]}},
+    {"$lookup": {
+        "from": users_collection.name,
+        "localField": "_dish_refs",
+        "foreignField": "favorite_dishes",
+        "pipeline": [{"$count": "n"}],
+        "as": "_favorites",
+    }},
+    {"$lookup": {
+        "from": comments_collection.name,
+        "localField": "_dish_refs",
+        "foreignField": "dish_id",
+        "pipeline": [{"$match": {"deleted_at": {"$exists": False}}}, {"$count": "n"}],
+        "as": "_comments",
+    }},
+]
+
+def _joined_count(doc: dict, field: str) -> int:
+    """Read the {"n": count} produced by a $lookup + $count stage (empty list means 0)"""
+    joined = doc.get(field)
+    return joined[0]["n"] if joined else 0
+
+def _to_detail_dict_list(docs) -> List[dict]:
+    """Convert a batch of MongoDB documents for list endpoints"""
+    to_dict = _to_detail_dict
+    return [to_dict(d) for d in docs]
+
+async def _stream_json_array(cursor, convert):
+    """
+    Stream a Motor cursor as a JSON array, one document at a time
+    ✅ Avoids to_list(length=None) buffering the whole result set in memory
+    """
+    sep = b"["
+    async for doc in cursor:
+        yield sep + orjson.dumps(convert(doc))
+        sep = b","
+    yield b"[]" if sep == b"[" else b"]"
+
+# Fields copied from user input by _clean_dish_data (empty values are dropped)
+_DISH_INPUT_FIELDS = ("name", "cooking_time", "ingredients", "image_url", "image_public_id", "creator_id", "recipe_id", "difficulty")
+_EMPTY_VALUES = (None, "", [], {})
 
 def _clean_dish_data(dish_dict: dict) -> dict:
-    cleaned = {}
-    for k in ["name", "cooking_time", "ingredients"]:
-        if k in dish_dict and dish_dict[k] not in (None, "", [], {}):
-            cleaned[k] = dish_dict[k]
-    for k in ["image_url", "creator_id", "recipe_id", "difficulty"]:
-        if k in dish_dict and dish_dict[k] not in (None, "", [], {}):
-            cleaned[k] = dish_dict[k]
+    get = dish_dict.get
+    cleaned = {
+        k: v for k in _DISH_INPUT_FIELDS
+        if (v := get(k)) not in _EMPTY_VALUES
+    }
     
     # ✅ Initialize all default fields for new dishes
     current_time = datetime.now(timezone.utc)
@@ -126,26 +313,19 @@ async def upload_image_to_cloudinary(image_b64: str, image_mime: str, folder: st
         if not CLOUDINARY_ENABLED:
             raise HTTPException(status_code=503, detail="Image upload service not available")
         
-        logging.info(f"Uploading image to cloud storage, folder: {folder}")
+        logger.info("Uploading image to cloud storage, folder: %s", folder)
         
         # ✅ Add basic size validation
-        image_data = base64.b64decode(image_b64)
-        
-        # Check file size (limit to 10MB)
-        if len(image_data) > 10 * 1024 * 1024:
+        # Check file size (limit to 10MB) from the base64 length, before decoding anything
+        estimated_size = (len(image_b64) * 3) // 4 - image_b64.count("=", -2)
+        if estimated_size > MAX_IMAGE_BYTES:
             raise HTTPException(status_code=413, detail="Image too large. Max size is 10MB.")
         
-        upload_result = cloudinary.uploader.upload(
-            image_data,
-            folder=folder,
-            resource_type="image",
-            transformation=[
-                {"quality": "auto:good"},
-                {"fetch_format": "auto"}
-            ]
-        )
+        image_data = base64.b64decode(image_b64)
+        
+        upload_result = await _cloudinary_upload(image_data, folder)
         
-        logging.info(f"Successfully uploaded image: {upload_result['secure_url']}")
+        logger.info("Successfully uploaded image: %s", upload_result['secure_url'])
         
         # ✅ Return both secure_url and public_id for flexibility
         return {
@@ -157,7 +337,7 @@ async def upload_image_to_cloudinary(image_b64: str, image_mime: str, folder: st
     except HTTPException:
         raise  # Re-raise HTTP exceptions
     except Exception as e:
-        logging.error(f"Failed to upload image to cloud storage: {str(e)}")
+        logger.error("Failed to upload image to cloud storage: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
 
 def get_optimized_image_url(public_id: str, width: int = None, height: int = None, crop: str = "auto") -> str:
@@ -184,7 +364,7 @@ def get_optimized_image_url(public_id: str, width: int = None, height: int = Non
         
         return optimized_url
     except Exception as e:
-        logging.error(f"Failed to generate optimized URL: {str(e)}")
+        logger.error("Failed to generate optimized URL: %s", e)
         return public_id
 
 # Helper function to get user ID from different possible fields
@@ -199,21 +379,180 @@ def _get_user_identification(user_doc):
     
     return user_id, user_email, user_username
 
-def _validate_object_id(id_str: str, field_name: str = "ID") -> ObjectId:
+# public_id = path after /upload/, minus the optional version segment and file extension
+_CLOUDINARY_PUBLIC_ID_RE = re.compile(r"cloudinary\.com/[^/]+/image/upload/(?:v\d+/)?(?P<pid>.+?)(?:\.[^./]+)?$")
+
+def _extract_cloudinary_public_id(dish: dict) -> Optional[str]:
     """
-    Validate and convert string to ObjectId
-    Raises HTTPException if invalid
+    Get the Cloudinary public_id for a dish image - stored value or parsed from image_url
+    URL format: https://res.cloudinary.com/<cloud>/image/upload/v<version>/<public_id>
+    Shared rule for the delete paths, the admin purge and main_async's auto cleanup
     """
-    if not id_str or not isinstance(id_str, str):
-        raise HTTPException(status_code=400, detail=f"Invalid {field_name}: empty or not string")
+    public_id = (
+        dish.get("image_public_id")          # Stored at upload time (create/update dish)
+        or dish.get("cloudinary_public_id")  # Re-hosted by the base64 image migration
+        or dish.get("public_id")             # Older documents
+    )
     
-    if not ObjectId.is_valid(id_str):
-        raise HTTPException(status_code=400, detail=f"Invalid {field_name} format")
+    if not public_id and dish.get("image_url"):
+        # Fallback for dishes uploaded before any public_id was stored
+        m = _CLOUDINARY_PUBLIC_ID_RE.search(dish["image_url"])
+        public_id = m.group("pid") if m else None
     
+    return public_id
+
+async def _destroy_cloudinary_image(public_id: str) -> dict:
+    """Delete an image from Cloudinary without blocking the event loop"""
+    result = await _cloudinary_destroy(public_id)
+    logger.info("Cloudinary image deleted: %s, result: %s", public_id, result)
+    return result
+
+# Durable queue of Cloudinary deletions - an entry is removed once the image is gone,
+# leftovers (crash / API error) are retried by retry_pending_cloudinary_deletes
+pending_cloudinary_deletes_col = db["pending_cloudinary_deletes"]
+
+async def _process_cloudinary_delete(public_id: str):
+    """Background task: destroy the image, then drop it from the pending queue"""
     try:
-        return ObjectId(id_str)
-    except Exception:
-        raise HTTPException(status_code=400, detail=f"Invalid {field_name} format")
+        await _destroy_cloudinary_image(public_id)
+        await pending_cloudinary_deletes_col.delete_one({"public_id": public_id})
+    except Exception as e:
+        logger.error("Failed to delete Cloudinary image %s (will retry later): %s", public_id, e)
+
+async def _schedule_cloudinary_delete(background_tasks: BackgroundTasks, public_id: str):
+    """Record the deletion durably and run it after the response is sent"""
+    await pending_cloudinary_deletes_col.update_one(
+        {"public_id": public_id},
+        {"$setOnInsert": {"public_id": public_id, "created_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    background_tasks.add_task(_process_cloudinary_delete, public_id)
+
+async def retry_pending_cloudinary_deletes(older_than_minutes: int = 10):
+    """
+    Reaper job: retry Cloudinary deletions whose background task never completed
+    Scheduled from main_async
+    """
+    if not CLOUDINARY_ENABLED:
+        return
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=older_than_minutes)
+    async for entry in pending_cloudinary_deletes_col.find({"created_at": {"$lt": cutoff}}):
+        await _process_cloudinary_delete(entry["public_id"])
+
+async def _run_cleanup(ops: Dict[str, Awaitable]) -> Dict[str, Any]:
+    """
+    Run independent cleanup operations concurrently
+    Failures are logged per operation and returned as the exception instance
+    """
+    results = await asyncio.gather(*ops.values(), return_exceptions=True)
+    outcome = {}
+    for name, result in zip(ops, results):
+        if isinstance(result, Exception):
+            logger.error("Error in cleanup step '%s': %s", name, result)
+        outcome[name] = result
+    return outcome
+
+def _result_count(result, attr: str) -> int:
+    """Count from a cleanup step's result - 0 if the step was skipped or failed"""
+    if result is None or isinstance(result, Exception):
+        return 0
+    return getattr(result, attr)
+
+def _dish_refs(dish_id: str, dish_oid: ObjectId) -> dict:
+    """
+    $in matcher for a dish reference stored in another collection
+    favorite_dishes / viewed ids / comments.dish_id / target_id are written as strings today;
+    matching the ObjectId form too keeps cleanup correct while those fields move to ObjectId
+    """
+    return {"$in": [dish_id, dish_oid]}
+
+# Fields the delete handlers read from the dish document (skip ingredients, ratings, etc.)
+_DISH_CLEANUP_PROJECTION = {
+    "name": 1, "creator_id": 1, "deleted_at": 1, "recipe_id": 1,
+    # Everything _extract_cloudinary_public_id reads
+    "image_url": 1, "image_public_id": 1, "cloudinary_public_id": 1, "public_id": 1,
+}
+
+async def _raise_dish_guard_failure(dish_oid: ObjectId, user_id: str, expect_deleted: bool, state_error: str, action: str):
+    """
+    A conditional (owner + deleted-state) write matched nothing - work out why and raise
+    Only runs on the failure path, with a cheap projected read
+    """
+    probe = await dishes_collection.find_one({"_id": dish_oid}, {"creator_id": 1, "deleted_at": 1})
+    if not probe:
+        raise HTTPException(status_code=404, detail="Dish not found")
+    
+    if ("deleted_at" in probe) != expect_deleted:
+        raise HTTPException(status_code=400, detail=state_error)
+    
+    logger.warning("Unauthorized %s attempt: User %s tried to %s dish %s owned by %s", action, user_id, action, dish_oid, probe.get('creator_id'))
+    raise HTTPException(status_code=403, detail=f"You can only {action} your own dishes")
+
+async def _authorize_and_load(
+    dish_id: str,
+    decoded,
+    write: Callable[[dict, str], Awaitable[Optional[dict]]],
+    *,
+    require_deleted: bool,
+    state_error: str,
+    action: str,
+) -> Tuple[dict, str, ObjectId]:
+    """
+    Shared owner-guarded write for restore / soft delete / permanent delete
+    
+    Resolves the current user, then calls write(guard_filter, user_id) where guard_filter
+    already carries the _id + owner + deleted-state conditions. The write must return the
+    matched document (or None) - on None the failure is diagnosed and raised as 404/400/403.
+    
+    Returns (dish, user_id, dish_oid)
+    """
+    dish_oid = ObjectId(dish_id)
+    user = await get_user_by_email(extract_user_email(decoded), decoded)
+    user_id = str(user["_id"])
+    
+    guard_filter = {
+        "_id": dish_oid,
+        "creator_id": user_id,
+        # $exists matches how listings define "deleted" (and the partial deleted_at index)
+        "deleted_at": {"$exists": require_deleted},
+    }
+    dish = await write(guard_filter, user_id)
+    if not dish:
+        await _raise_dish_guard_failure(dish_oid, user_id, require_deleted, state_error, action)
+    return dish, user_id, dish_oid
+
+# ✅ Per-dish locks for owner write operations (restore / soft delete / permanent delete)
+# Weak values: an entry disappears once no request holds its lock
+# Per-worker only - across workers the conditional write filters still keep this correct
+_dish_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+@asynccontextmanager
+async def _dish_operation_lock(dish_id: str):
+    """
+    Reject a concurrent write on the same dish with 409 instead of letting it
+    repeat the guarded write, failure probe and cleanup fan-out
+    """
+    lock = _dish_locks.setdefault(dish_id, asyncio.Lock())
+    if lock.locked():
+        raise HTTPException(status_code=409, detail="Another operation on this dish is in progress")
+    async with lock:
+        yield
+
+def _to_object_id(value) -> Optional[ObjectId]:
+    """Parse an ObjectId once - None if the value isn't a valid id"""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+def _check_object_id(id_str: str) -> str:
+    """Pydantic validator: reject strings that are not valid ObjectIds"""
+    if not ObjectId.is_valid(id_str):
+        raise ValueError("Invalid ObjectId format")
+    return id_str
+
+# ✅ Path-parameter type - FastAPI validates it (422 on bad input) before the handler runs
+ObjectIdStr = Annotated[str, AfterValidator(_check_object_id)]
 
 # ============= ROUTES (CORRECT ORDER) =============
 
@@ -226,6 +565,7 @@ async def create_dish(dish: DishIn, decoded=Depends(get_current_user)):
     payload = dish.dict()
     
     image_url = None
+    image_public_id = None
     if payload.get("image_b64") and payload.get("image_mime"):
         upload_result = await upload_image_to_cloudinary(
             payload["image_b64"], 
@@ -233,6 +573,7 @@ async def create_dish(dish: DishIn, decoded=Depends(get_current_user)):
             folder="dishes"
         )
         image_url = upload_result["secure_url"]
+        image_public_id = upload_result["public_id"]
 
     new_doc = _clean_dish_data({
         "name": payload["name"],
@@ -240,6 +581,7 @@ async def create_dish(dish: DishIn, decoded=Depends(get_current_user)):
         "ingredients": payload.get("ingredients", []),
         "difficulty": payload.get("difficulty", "easy"),
         "image_url": image_url,
+        "image_public_id": image_public_id,
         "creator_id": str(user["_id"]),
     })
 
@@ -275,6 +617,7 @@ async def create_dish_with_recipe(data: DishWithRecipeIn, decoded=Depends(get_cu
     image_mime = getattr(data, "image_mime", None)
     
     image_url = None
+    image_public_id = None
     if image_b64 and image_mime:
         upload_result = await upload_image_to_cloudinary(
             image_b64, 
@@ -282,6 +625,7 @@ async def create_dish_with_recipe(data: DishWithRecipeIn, decoded=Depends(get_cu
             folder="dishes"
         )
         image_url = upload_result["secure_url"]
+        image_public_id = upload_result["public_id"]
 
     dish_doc = _clean_dish_data({
         "name": data.name,
@@ -289,6 +633,7 @@ async def create_dish_with_recipe(data: DishWithRecipeIn, decoded=Depends(get_cu
         "cooking_time": data.cooking_time,
         "difficulty": normalized_difficulty,
         "image_url": image_url,
+        "image_public_id": image_public_id,
         "creator_id": str(user["_id"]),
     })
     
@@ -309,8 +654,8 @@ async def create_dish_with_recipe(data: DishWithRecipeIn, decoded=Depends(get_cu
         "ratings": [],
         "average_rating": 0.0,
         "image_url": image_url,
-        # ✅ Fix: Use timezone-aware datetime
-        "created_at": datetime.now(timezone.utc),
+        # ✅ Fix: Use timezone-aware datetime (same timestamp as the dish)
+        "created_at": dish_doc["created_at"],
     }
     
     recipe_result = await recipe_collection.insert_one(recipe_doc)
@@ -333,42 +678,37 @@ async def create_dish_with_recipe(data: DishWithRecipeIn, decoded=Depends(get_cu
 
 @router.post("/check-favorites", response_model=Dict[str, bool])
 async def check_favorites(request: CheckFavoritesRequest, decoded=Depends(get_current_user)):
-    import logging
-    logger = logging.getLogger(__name__)
-    
     try:
         user_email = extract_user_email(decoded)
-        logger.info(f"🔍 Check favorites - User email: {user_email}")
+        logger.info("🔍 Check favorites - User email: %s", user_email)
         
         # ✅ Use get_user_by_email for consistency
         user = await get_user_by_email(user_email, decoded)  # ✅ Pass decoded token
-        logger.info(f"✅ User found: {user.get('_id')} - {user.get('email')}")
+        logger.info("✅ User found: %s - %s", user.get('_id'), user.get('email'))
         
-        favorite_dish_ids = user.get("favorite_dishes", [])
-        logger.info(f"📋 User has {len(favorite_dish_ids)} favorite dishes")
+        # ✅ Normalize to strings (favorites may be stored as str or ObjectId) - O(1) lookups
+        favorite_dish_ids = {str(x) for x in user.get("favorite_dishes") or []}
+        logger.info("📋 User has %s favorite dishes", len(favorite_dish_ids))
         
-        result = {}
-        for dish_id in request.dish_ids:
-            result[dish_id] = dish_id in favorite_dish_ids
+        result = {dish_id: dish_id in favorite_dish_ids for dish_id in request.dish_ids}
             
-        logger.info(f"✅ Check favorites result: {len(result)} dishes checked")
+        logger.info("✅ Check favorites result: %s dishes checked", len(result))
         return result
         
     except HTTPException:
         raise  # Re-raise HTTP exceptions  
     except Exception as e:
-        logger.error(f"❌ Error checking favorites: {str(e)}")
-        logger.error(f"📧 User email: {decoded.get('email', 'N/A')}")
-        logger.error(f"🆔 User UID: {decoded.get('uid', 'N/A')}")
+        logger.error("❌ Error checking favorites: %s", e)
+        logger.error("📧 User email: %s", decoded.get('email', 'N/A'))
+        logger.error("🆔 User UID: %s", decoded.get('uid', 'N/A'))
         raise HTTPException(status_code=500, detail=f"Failed to check favorites: {str(e)}")
 
 @router.post("/{dish_id}/rate")
-async def rate_dish(dish_id: str, rating: int, decoded=Depends(get_current_user)):
+async def rate_dish(dish_id: ObjectIdStr, rating: int, decoded=Depends(get_current_user)):
     if rating < 1 or rating > 5:
         raise HTTPException(status_code=400, detail="Rating must be 1-5")
     
-    # ✅ Validate ObjectId before using
-    dish_oid = _validate_object_id(dish_id, "dish_id")
+    dish_oid = ObjectId(dish_id)
     
     # ✅ Check dish exists first
     d = await dishes_collection.find_one({"_id": dish_oid})
@@ -404,6 +744,7 @@ async def rate_dish(dish_id: str, rating: int, decoded=Depends(get_current_user)
             {"_id": dish_oid},
             {"$set": {"average_rating": new_average}}
         )
+        _invalidate_dish_cache(dish_id)
         
         return {
             "msg": "Rating added successfully", 
@@ -414,56 +755,59 @@ async def rate_dish(dish_id: str, rating: int, decoded=Depends(get_current_user)
         raise HTTPException(status_code=404, detail="Dish not found")
 
 @router.post("/{dish_id}/toggle-favorite")
-async def toggle_favorite_dish(dish_id: str, decoded=Depends(get_current_user)):
-    import logging
-    logger = logging.getLogger(__name__)
-    
+async def toggle_favorite_dish(dish_id: ObjectIdStr, decoded=Depends(get_current_user)):
     try:
-        # ✅ Validate ObjectId before using
-        dish_oid = _validate_object_id(dish_id, "dish_id")
-        
-        # ✅ Check if dish exists first
-        dish_exists = await dishes_collection.find_one({"_id": dish_oid}, {"_id": 1})
-        if not dish_exists:
-            raise HTTPException(status_code=404, detail="Dish not found")
+        dish_oid = ObjectId(dish_id)
         
         # ✅ Use consistent method for getting user email and user data
         user_email = extract_user_email(decoded)
-        logger.info(f"🔍 Toggle favorite - User email: {user_email}")
+        logger.info("🔍 Toggle favorite - User email: %s", user_email)
         
-        # ✅ Use get_user_by_email for consistency with other endpoints
-        user = await get_user_by_email(user_email, decoded)  # ✅ Pass decoded token
-        logger.info(f"✅ User found: {user.get('_id')} - {user.get('email')}")
+        # ✅ Dish existence check and user lookup are independent - overlap the round-trips
+        dish_exists, user = await asyncio.gather(
+            dishes_collection.find_one({"_id": dish_oid}, {"_id": 1}),
+            get_user_by_email(user_email, decoded),  # ✅ Pass decoded token
+        )
+        if not dish_exists:
+            raise HTTPException(status_code=404, detail="Dish not found")
+        logger.info("✅ User found: %s - %s", user.get('_id'), user.get('email'))
         
         favorite_ids = user.get("favorite_dishes") or []
         dish_id_str = str(dish_oid)
         
-        logger.info(f"📋 Current favorites: {len(favorite_ids)} dishes")
-        logger.info(f"❤️ Toggling dish: {dish_id_str}")
+        logger.info("📋 Current favorites: %s dishes", len(favorite_ids))
+        logger.info("❤️ Toggling dish: %s", dish_id_str)
         
-        if dish_id_str in favorite_ids:
-            # Remove from favorites
-            await users_collection.update_one(
-                {"_id": user["_id"]},
-                {"$pull": {"favorite_dishes": dish_id_str}}
+        if dish_id_str in favorite_ids or dish_oid in favorite_ids:
+            # Remove from favorites (either stored form)
+            # Filter on membership so favorites_version only moves when the list changes
+            dish_refs = _dish_refs(dish_id_str, dish_oid)
+            result = await users_collection.update_one(
+                {"_id": user["_id"], "favorite_dishes": dish_refs},
+                {"$pull": {"favorite_dishes": dish_refs}, "$inc": {"favorites_version": 1}}
             )
-            logger.info(f"➖ Removed dish {dish_id_str} from favorites")
+            if result.modified_count:
+                # Maintained counter - notify_favorite reads it instead of counting
+                await dishes_collection.update_one({"_id": dish_oid}, {"$inc": {"favorite_count": -1}})
+            logger.info("➖ Removed dish %s from favorites", dish_id_str)
             return {"isFavorite": False, "message": "Removed from favorites"}
         else:
             # Add to favorites
-            await users_collection.update_one(
-                {"_id": user["_id"]},
-                {"$addToSet": {"favorite_dishes": dish_id_str}}
+            result = await users_collection.update_one(
+                {"_id": user["_id"], "favorite_dishes": {"$ne": dish_id_str}},
+                {"$addToSet": {"favorite_dishes": dish_id_str}, "$inc": {"favorites_version": 1}}
             )
-            logger.info(f"➕ Added dish {dish_id_str} to favorites")
+            if result.modified_count:
+                await dishes_collection.update_one({"_id": dish_oid}, {"$inc": {"favorite_count": 1}})
+            logger.info("➕ Added dish %s to favorites", dish_id_str)
             return {"isFavorite": True, "message": "Added to favorites"}
             
     except HTTPException:
         raise  # Re-raise HTTP exceptions
     except Exception as e:
-        logger.error(f"❌ Error in toggle_favorite_dish: {str(e)}")
-        logger.error(f"📧 User email: {decoded.get('email', 'N/A')}")
-        logger.error(f"🆔 User UID: {decoded.get('uid', 'N/A')}")
+        logger.error("❌ Error in toggle_favorite_dish: %s", e)
+        logger.error("📧 User email: %s", decoded.get('email', 'N/A'))
+        logger.error("🆔 User UID: %s", decoded.get('uid', 'N/A'))
         raise HTTPException(status_code=500, detail=f"Failed to toggle favorite: {str(e)}")
 
 # ============= GET ROUTES (SPECIFIC FIRST, DYNAMIC LAST) =============
@@ -475,7 +819,12 @@ async def get_high_rated_dishes(min_rating: float = 4.0, limit: int = 50, skip:
     CRITICAL: Returns ONLY dishes with average_rating >= min_rating
     Used by Recipe screen to show featured/popular dishes
     """
-    logging.info(f"Fetching high-rated dishes - min_rating: {min_rating}, limit: {limit}, skip: {skip}")
+    logger.info("Fetching high-rated dishes - min_rating: %s, limit: %s, skip: %s", min_rating, limit, skip)
+    
+    cache_key = ("high-rated", min_rating, limit, skip)
+    cached = _dish_list_cache.get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
     
     try:
         # Query for dishes with rating >= min_rating AND valid name
@@ -485,24 +834,25 @@ async def get_high_rated_dishes(min_rating: float = 4.0, limit: int = 50, skip:
             "deleted_at": {"$exists": False}  # ✅ Exclude deleted dishes
         }
         
-        logging.info(f"High-rated query: {query}")
+        logger.info("High-rated query: %s", query)
         
-        cursor = dishes_collection.find(query).sort("average_rating", -1).skip(skip).limit(limit)
+        cursor = dishes_read_collection.find(query).sort("average_rating", -1).skip(skip).limit(limit)
         high_rated_docs = await cursor.to_list(length=limit)
         
-        logging.info(f"Found {len(high_rated_docs)} high-rated dishes")
+        logger.info("Found %s high-rated dishes", len(high_rated_docs))
         
         # Convert to response format
-        result = [_to_detail_out(d) for d in high_rated_docs]
+        result = _to_detail_dict_list(high_rated_docs)
         
         # Log sample for debugging
         if result:
-            logging.info(f"Sample high-rated dish: {result[0].name} (rating: {result[0].average_rating})")
+            logger.info("Sample high-rated dish: %s (rating: %s)", result[0]['name'], result[0]['average_rating'])
         
-        return result
+        _dish_list_cache.set(cache_key, result)
+        return ORJSONResponse(result)
         
     except Exception as e:
-        logging.error(f"Error in get_high_rated_dishes: {str(e)}")
+        logger.error("Error in get_high_rated_dishes: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch high-rated dishes: {str(e)}")
 
 # FIXED: My dishes endpoint for Profile screen  
@@ -523,12 +873,12 @@ async def get_my_dishes(
         user = await get_user_by_email(user_email, decoded)  # ✅ Pass decoded token
         
         if not user:
-            logging.error(f"User not found for email: {user_email}")
+            logger.error("User not found for email: %s", user_email)
             raise HTTPException(status_code=404, detail="User not found")
         
         user_id, user_email_from_doc, user_username = _get_user_identification(user)
         
-        logging.info(f"Fetching dishes for user - ID: {user_id}, Email: {user_email_from_doc}, Search: {search}")
+        logger.info("Fetching dishes for user - ID: %s, Email: %s, Search: %s", user_id, user_email_from_doc, search)
         
         # Build comprehensive query to find user's dishes
         # Check multiple possible fields where user ID might be stored
@@ -545,42 +895,47 @@ async def get_my_dishes(
         }
         
         # ✅ Safe ObjectId conversion - only if valid
-        if ObjectId.is_valid(user_id):
-            query["$or"].append({"creator_id": ObjectId(user_id)})  # ObjectId version
+        user_oid = _to_object_id(user_id)
+        if user_oid:
+            query["$or"].append({"creator_id": user_oid})  # ObjectId version
         
         # Also include username if available
         if user_username:
             query["$or"].append({"created_by": user_username})
         
         # Add search filter if provided
+        # ✅ Anchored + escaped prefix match - walks the name index (see ensure_dish_indexes)
+        # instead of scanning, and keeps the partial-name matching the Profile search relies on
         if search and search.strip():
-            query["name"] = {"$regex": search.strip(), "$options": "i"}
+            query["name"] = {"$regex": f"^{re.escape(search.strip())}", "$options": "i"}
         
-        logging.info(f"My dishes query: {query}")
+        logger.info("My dishes query: %s", query)
         
-        # When searching, return all results (no limit)
-        actual_limit = limit if not search else 0
         cursor = dishes_collection.find(query).sort("created_at", -1).skip(skip)
-        if actual_limit > 0:
-            cursor = cursor.limit(actual_limit)
-            
-        user_dishes = await cursor.to_list(length=None if not actual_limit else actual_limit)
         
-        logging.info(f"Found {len(user_dishes)} dishes for user {user_id}")
+        # When searching, return all results (no limit) - stream instead of buffering
+        if search:
+            return StreamingResponse(
+                _stream_json_array(cursor, _to_detail_dict),
+                media_type="application/json"
+            )
+        
+        user_dishes = await cursor.limit(limit).to_list(length=limit or None)
+        
+        logger.info("Found %s dishes for user %s", len(user_dishes), user_id)
         
         # Log sample dishes for debugging
         if user_dishes:
-            logging.info("Sample user dishes:")
+            logger.info("Sample user dishes:")
             for i, dish in enumerate(user_dishes[:3]):  # Log first 3
-                logging.info(f"  {i+1}. {dish.get('name')} - creator_id: {dish.get('creator_id')}")
+                logger.info("  %s. %s - creator_id: %s", i+1, dish.get('name'), dish.get('creator_id'))
         
-        result = [_to_detail_out(dish) for dish in user_dishes]
-        return result
+        return ORJSONResponse(_to_detail_dict_list(user_dishes))
         
     except HTTPException:
         raise  # Re-raise HTTP exceptions
     except Exception as e:
-        logging.error(f"Error in get_my_dishes: {str(e)}")
+        logger.error("Error in get_my_dishes: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch user dishes: {str(e)}")
 
 @router.get("/suggest/today", response_model=List[DishDetailOut])
@@ -588,46 +943,63 @@ async def suggest_today(limit: int = 12):
     """
     Returns recent dishes for today's suggestions
     """
+    cache_key = ("suggest-today", limit)
+    cached = _dish_list_cache.get(cache_key)
+    if cached is not None:
+        return ORJSONResponse(cached)
+    
     try:
         query = {
             "name": {"$exists": True, "$ne": "", "$ne": None},
             "deleted_at": {"$exists": False}  # ✅ Exclude deleted dishes
         }
-        cursor = dishes_collection.find(query).sort("created_at", -1).limit(limit)
+        cursor = dishes_read_collection.find(query).sort("created_at", -1).limit(limit)
         docs = await cursor.to_list(length=limit)
-        return [_to_detail_out(d) for d in docs]
+        result = _to_detail_dict_list(docs)
+        _dish_list_cache.set(cache_key, result)
+        return ORJSONResponse(result)
     except Exception as e:
-        logging.error(f"Error in suggest_today: {str(e)}")
+        logger.error("Error in suggest_today: %s", e)
         return []  # Return empty list on error
 
 @router.get("/random", response_model=List[DishDetailOut])
 async def get_random_dishes(limit: int = 3):
     """
     Returns random dishes
+    ✅ Samples from a cached pool of candidate ids instead of running $sample per request
     """
     try:
-        pipeline = [
-            {"$match": {
-                "name": {"$exists": True, "$ne": "", "$ne": None},
-                "deleted_at": {"$exists": False}  # ✅ Exclude deleted dishes
-            }},
-            {"$sample": {"size": limit}},
-        ]
+        active_query = {
+            "name": {"$exists": True, "$ne": "", "$ne": None},
+            "deleted_at": {"$exists": False}  # ✅ Exclude deleted dishes
+        }
         
-        docs = await dishes_collection.aggregate(pipeline).to_list(length=limit)
-        return [_to_detail_out(d) for d in docs]
+        pool = _random_pool_cache.get("ids")
+        if pool is None:
+            pool_docs = await dishes_read_collection.find(
+                active_query, {"_id": 1}
+            ).sort("created_at", -1).limit(RANDOM_POOL_SIZE).to_list(length=RANDOM_POOL_SIZE)
+            pool = [d["_id"] for d in pool_docs]
+            _random_pool_cache.set("ids", pool)
+        
+        picked = random.sample(pool, min(limit, len(pool)))
+        docs = await dishes_read_collection.find(
+            {**active_query, "_id": {"$in": picked}}
+        ).to_list(length=len(picked))
+        random.shuffle(docs)
+        return ORJSONResponse(_to_detail_dict_list(docs))
         
     except Exception as e:
-        logging.error(f"Error fetching random dishes: {str(e)}")
+        logger.error("Error fetching random dishes: %s", e)
         # Fallback to regular query
         try:
-            cursor = dishes_collection.find(
+            cursor = dishes_read_collection.find(
                 {"name": {"$exists": True, "$ne": "", "$ne": None}}
             ).sort("created_at", -1).limit(limit)
             docs = await cursor.to_list(length=limit)
-            return [_to_detail_out(d) for d in docs]
+            return ORJSONResponse(_to_detail_dict_list(docs))
         except Exception as fallback_e:
-            logging.error(f"Fallback query also failed: {str(fallback_e)}")
+            logger.error("Fallback query also failed: %s", fallback_e)
             return []
 
 # FIXED: Main dishes list endpoint - handles both general and user-specific queries
@@ -650,7 +1022,7 @@ async def get_dishes(
             user = await get_user_by_email(user_email, decoded)  # ✅ Pass decoded token
             
             if not user:
-                logging.warning(f"User not found for my_dishes query: {user_email}")
+                logger.warning("User not found for my_dishes query: %s", user_email)
                 return []  # Return empty list if user not found
             
             user_id, user_email_from_doc, user_username = _get_user_identification(user)
@@ -667,8 +1039,9 @@ async def get_dishes(
             }
             
             # ✅ Safe ObjectId conversion - only if valid
-            if ObjectId.is_valid(user_id):
-                user_filter["$or"].append({"creator_id": ObjectId(user_id)})
+            user_oid = _to_object_id(user_id)
+            if user_oid:
+                user_filter["$or"].append({"creator_id": user_oid})
             
             if user_username:
                 user_filter["$or"].append({"created_by": user_username})
@@ -676,25 +1049,45 @@ async def get_dishes(
             # Combine base query with user filter
             query = {"$and": [base_query, user_filter]}
             
-            logging.info(f"My dishes query via main endpoint: {query}")
+            logger.info("My dishes query via main endpoint: %s", query)
         else:
             query = base_query
-            logging.info(f"All dishes query: {query}")
+            logger.info("All dishes query: %s", query)
         
         cursor = dishes_collection.find(query).sort("created_at", -1).skip(skip).limit(limit)
         dishes = await cursor.to_list(length=limit)
         
-        logging.info(f"Found {len(dishes)} dishes (my_dishes={my_dishes})")
+        logger.info("Found %s dishes (my_dishes=%s)", len(dishes), my_dishes)
         
-        return [_to_detail_out(dish) for dish in dishes]
+        return ORJSONResponse(_to_detail_dict_list(dishes))
         
     except Exception as e:
-        logging.error(f"Error in get_dishes: {str(e)}")
+        logger.error("Error in get_dishes: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch dishes: {str(e)}")
 
 # ============= TRASH / RECYCLE BIN ENDPOINTS =============
 # ⚠️ MUST come BEFORE dynamic routes (/{dish_id}) to avoid "trash" being treated as dish_id
 
+def _to_trash_item(dish) -> dict:
+    """Convert a soft-deleted dish document to the trash list format"""
+    dish_data = {
+        "id": str(dish["_id"]),
+        "label": dish.get("name", ""),
+        "image": dish.get("image_url", ""),
+        "time": f"{dish.get('cooking_time', 0)} phút",
+        "star": dish.get("average_rating", 0),
+        "level": dish.get("difficulty", "easy"),
+        "isFavorite": False,  # Deleted dishes are not favorite
+    }
+    
+    if dish.get("deleted_at"):
+        # Add 7 days to deleted_at for recovery deadline
+        recovery_deadline = dish["deleted_at"] + timedelta(days=7)
+        dish_data["deleted_at"] = dish["deleted_at"]
+        dish_data["recovery_deadline"] = recovery_deadline
+    
+    return dish_data
+
 @router.get("/trash")
 async def get_trash_dishes(decoded=Depends(get_current_user)):
     """
@@ -706,65 +1099,46 @@ async def get_trash_dishes(decoded=Depends(get_current_user)):
     ✅ Sorted by deleted_at (newest first)
     """
     try:
-        logging.info(f"📋 GET /trash - Starting request")
-        logging.info(f"🔍 Decoded token: {decoded}")
+        logger.info("📋 GET /trash - Starting request")
+        logger.info("🔍 Decoded token: %s", decoded)
         
         # Get user from decoded token (same pattern as get_my_dishes)
         user_email = extract_user_email(decoded)
-        logging.info(f"✅ Extracted email: {user_email}")
+        logger.info("✅ Extracted email: %s", user_email)
         
         user = await get_user_by_email(user_email, decoded)
         
         if not user:
-            logging.error(f"❌ User not found for email: {user_email}")
+            logger.error("❌ User not found for email: %s", user_email)
             raise HTTPException(status_code=404, detail="User not found")
         
         user_id = str(user["_id"])
-        logging.info(f"✅ User ID: {user_id}")
+        logger.info("✅ User ID: %s", user_id)
         
         # Find deleted dishes
         query = {
             "creator_id": user_id,
             "deleted_at": {"$exists": True, "$ne": None}  # ✅ Better MongoDB query
         }
-        logging.info(f"🔍 Query: {query}")
-        
-        deleted_dishes = await dishes_collection.find(query).sort("deleted_at", -1).to_list(length=None)
-        logging.info(f"📊 Found {len(deleted_dishes)} deleted dishes")
-        
-        # Convert to response format
-        result = []
-        for dish in deleted_dishes:
-            dish_data = {
-                "id": str(dish["_id"]),
-                "label": dish.get("name", ""),
-                "image": dish.get("image_url", ""),
-                "time": f"{dish.get('cooking_time', 0)} phút",
-                "star": dish.get("average_rating", 0),
-                "level": dish.get("difficulty", "easy"),
-                "isFavorite": False,  # Deleted dishes are not favorite
-            }
-            
-            if dish.get("deleted_at"):
-                # Add 7 days to deleted_at for recovery deadline
-                recovery_deadline = dish["deleted_at"] + timedelta(days=7)
-                dish_data["deleted_at"] = dish["deleted_at"].isoformat()
-                dish_data["recovery_deadline"] = recovery_deadline.isoformat()
-            
-            result.append(dish_data)
-        
-        logging.info(f"User {user_id} fetched {len(result)} deleted dishes from trash")
-        return result
+        logger.info("🔍 Query: %s", query)
+        
+        # ✅ Stream results instead of loading the whole trash into memory
+        cursor = dishes_collection.find(query).sort("deleted_at", -1)
+        logger.info("User %s streaming deleted dishes from trash", user_id)
+        return StreamingResponse(
+            _stream_json_array(cursor, _to_trash_item),
+            media_type="application/json"
+        )
         
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error fetching trash dishes: {str(e)}")
+        logger.error("Error fetching trash dishes: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to fetch trash: {str(e)}")
 
 
 @router.post("/{dish_id}/restore")
-async def restore_dish(dish_id: str, decoded=Depends(get_current_user)):
+async def restore_dish(dish_id: ObjectIdStr, decoded=Depends(get_current_user)):
     """
     Restore a soft-deleted dish
     
@@ -772,62 +1146,40 @@ async def restore_dish(dish_id: str, decoded=Depends(get_current_user)):
     ✅ Removes deleted_at and deleted_by fields
     ✅ Dish becomes visible again in listings
     """
-    try:
-        # Validate dish ID
-        dish_oid = _validate_object_id(dish_id, "dish_id")
-        
-        # Get dish
-        dish = await dishes_collection.find_one({"_id": dish_oid})
-        if not dish:
-            raise HTTPException(status_code=404, detail="Dish not found")
-        
-        # Check if deleted
-        if not dish.get("deleted_at"):
-            raise HTTPException(status_code=400, detail="Dish is not deleted")
-        
-        # Verify ownership
-        user_email = extract_user_email(decoded)
-        user = await get_user_by_email(user_email, decoded)
-        user_id = str(user["_id"])
-        
-        if dish.get("creator_id") != user_id:
-            logging.warning(f"Unauthorized restore attempt: User {user_id} tried to restore dish {dish_id}")
-            raise HTTPException(
-                status_code=403,
-                detail="You can only restore your own dishes"
+    async with _dish_operation_lock(dish_id):
+        try:
+            now = datetime.now(timezone.utc)
+        
+            # Restore dish - remove deleted fields
+            # ✅ Ownership and deleted-state checks are part of the filter (no read before the write)
+            _, user_id, _ = await _authorize_and_load(
+                dish_id, decoded,
+                lambda guard, _user_id: dishes_collection.find_one_and_update(
+                    guard,
+                    {"$unset": {"deleted_at": "", "deleted_by": ""}, "$set": {"updated_at": now}},
+                    projection={"_id": 1}
+                ),
+                require_deleted=True, state_error="Dish is not deleted", action="restore",
             )
         
-        # Restore dish - remove deleted fields
-        await dishes_collection.update_one(
-            {"_id": dish_oid},
-            {
-                "$unset": {
-                    "deleted_at": "",
-                    "deleted_by": ""
-                },
-                "$set": {
-                    "updated_at": datetime.now(timezone.utc)
-                }
-            }
-        )
-        
-        logging.info(f"Dish {dish_id} restored by user {user_id}")
+            _invalidate_dish_cache(dish_id)
+            logger.info("Dish %s restored by user %s", dish_id, user_id)
         
-        return {
-            "message": "Dish restored successfully",
-            "dish_id": dish_id,
-            "restored_at": datetime.now(timezone.utc).isoformat()
-        }
+            return {
+                "message": "Dish restored successfully",
+                "dish_id": dish_id,
+                "restored_at": now
+            }
         
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Error restoring dish {dish_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to restore dish: {str(e)}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error restoring dish %s: %s", dish_id, e)
+            raise HTTPException(status_code=500, detail=f"Failed to restore dish: {str(e)}")
 
 
 @router.delete("/{dish_id}/permanent")
-async def permanent_delete_dish(dish_id: str, decoded=Depends(get_current_user)):
+async def permanent_delete_dish(dish_id: ObjectIdStr, background_tasks: BackgroundTasks, decoded=Depends(get_current_user)):
     """
     Permanently delete a soft-deleted dish
     
@@ -839,367 +1191,353 @@ async def permanent_delete_dish(dish_id: str, decoded=Depends(get_current_user))
     ✅ Deletes associated recipe, comments, favorites
     ✅ Deletes image from Cloudinary
     """
-    try:
-        # Validate dish ID
-        dish_oid = _validate_object_id(dish_id, "dish_id")
-        
-        # Get dish
-        dish = await dishes_collection.find_one({"_id": dish_oid})
-        if not dish:
-            raise HTTPException(status_code=404, detail="Dish not found")
-        
-        # Check if deleted
-        if not dish.get("deleted_at"):
-            raise HTTPException(
-                status_code=400, 
-                detail="Dish must be soft-deleted first. Use DELETE /{dish_id} to soft-delete."
-            )
-        
-        # Verify ownership
-        user_email = extract_user_email(decoded)
-        user = await get_user_by_email(user_email, decoded)
-        user_id = str(user["_id"])
-        
-        if dish.get("creator_id") != user_id:
-            logging.warning(f"Unauthorized permanent delete attempt: User {user_id} tried to delete dish {dish_id}")
-            raise HTTPException(
-                status_code=403,
-                detail="You can only permanently delete your own dishes"
-            )
-        
-        # ✅ 1. Delete associated recipe
-        recipe_deleted = False
-        if dish.get("recipe_id"):
-            try:
-                recipe_oid = ObjectId(dish["recipe_id"])
-                result = await recipes_collection.delete_one({"_id": recipe_oid})
-                recipe_deleted = result.deleted_count > 0
-                logging.info(f"Deleted recipe {dish['recipe_id']} for dish {dish_id}")
-            except Exception as e:
-                logging.error(f"Error deleting recipe: {str(e)}")
-        
-        # ✅ 2. Delete all comments
-        comments_deleted = 0
+    async with _dish_operation_lock(dish_id):
         try:
-            result = await comments_collection.delete_many({"dish_id": dish_id})
-            comments_deleted = result.deleted_count
-            logging.info(f"Deleted {comments_deleted} comments for dish {dish_id}")
-        except Exception as e:
-            logging.error(f"Error deleting comments: {str(e)}")
-        
-        # ✅ 3. Remove from all users' favorites
-        favorites_removed = 0
-        try:
-            result = await users_collection.update_many(
-                {"favorite_dishes": dish_id},
-                {"$pull": {"favorite_dishes": dish_id}}
-            )
-            favorites_removed = result.modified_count
-            logging.info(f"Removed dish {dish_id} from {favorites_removed} users' favorites")
-        except Exception as e:
-            logging.error(f"Error removing from favorites: {str(e)}")
-        
-        # ✅ 4. Delete from user activity
-        activity_deleted = 0
-        try:
-            result = await user_activity_collection.delete_many({"target_id": dish_id})
-            activity_deleted = result.deleted_count
-            logging.info(f"Deleted {activity_deleted} activity records for dish {dish_id}")
-        except Exception as e:
-            logging.error(f"Error deleting activity: {str(e)}")
-        
-        # ✅ 5. Delete image from Cloudinary
-        cloudinary_deleted = False
-        if dish.get("image_url") and CLOUDINARY_ENABLED:
-            try:
-                # Extract public_id from image_url
-                public_id = dish.get("image_public_id")
+            now = datetime.now(timezone.utc)
+        
+            # ✅ 1-5. All database writes run in one transaction - commit together or not at all,
+            # so a failure midway can't orphan comments, favorites or activity entries
+            async with await mongo_client.start_session() as session:
+                async with session.start_transaction():
+                    # 1. Permanently delete dish from database
+                    # Ownership and soft-deleted state are part of the filter; the removed doc is returned for cleanup
+                    dish, user_id, dish_oid = await _authorize_and_load(
+                        dish_id, decoded,
+                        lambda guard, _user_id: dishes_collection.find_one_and_delete(
+                            guard, projection=_DISH_CLEANUP_PROJECTION, session=session
+                        ),
+                        require_deleted=True,
+                        state_error="Dish must be soft-deleted first. Use DELETE /{dish_id} to soft-delete.",
+                        action="permanently delete",
+                    )
                 
-                if not public_id and dish.get("image_url"):
-                    image_url = dish.get("image_url", "")
-                    if "cloudinary.com" in image_url:
-                        parts = image_url.split("/")
-                        if len(parts) >= 2:
-                            filename = parts[-1].split(".")[0]
-                            folder = parts[-2] if len(parts) >= 3 else "dishes"
-                            public_id = f"{folder}/{filename}"
+                    # 2. Delete associated recipe
+                    recipe_deleted = False
+                    recipe_oid = _to_object_id(dish.get("recipe_id"))
+                    if recipe_oid:
+                        result = await recipes_collection.delete_one({"_id": recipe_oid}, session=session)
+                        recipe_deleted = result.deleted_count > 0
                 
-                if public_id:
-                    result = cloudinary.uploader.destroy(public_id)
-                    cloudinary_deleted = (result.get("result") == "ok")
-                    logging.info(f"Deleted Cloudinary image: {public_id}, result: {result}")
-            except Exception as e:
-                logging.error(f"Error deleting Cloudinary image: {str(e)}")
-        
-        # ✅ 6. Permanently delete dish from database
-        await dishes_collection.delete_one({"_id": dish_oid})
+                    # 3. Delete all comments
+                    dish_refs = _dish_refs(dish_id, dish_oid)
+                    result = await comments_collection.delete_many({"dish_id": dish_refs}, session=session)
+                    comments_deleted = result.deleted_count
+                
+                    # 4. Remove from all users' favorites
+                    result = await users_collection.update_many(
+                        {"favorite_dishes": dish_refs},
+                        {"$pull": {"favorite_dishes": dish_refs}, "$inc": {"favorites_version": 1}},
+                        session=session
+                    )
+                    favorites_removed = result.modified_count
+                
+                    # 5. Delete from user activity
+                    result = await user_activity_collection.delete_many({"target_id": dish_refs}, session=session)
+                    activity_deleted = result.deleted_count
         
-        logging.warning(f"PERMANENT DELETE: Dish {dish_id} permanently deleted by user {user_id}")
+            logger.info(
+                "Dish %s cleanup: recipe_deleted=%s, %s comments, %s favorites, %s activity records removed",
+                dish_id, recipe_deleted, comments_deleted, favorites_removed, activity_deleted
+            )
         
-        return {
-            "message": "Dish permanently deleted",
-            "dish_id": dish_id,
-            "deleted_at": datetime.now(timezone.utc).isoformat(),
-            "cleanup_summary": {
-                "recipe_deleted": recipe_deleted,
-                "comments_deleted": comments_deleted,
-                "favorites_removed": favorites_removed,
-                "activity_deleted": activity_deleted,
-                "cloudinary_deleted": cloudinary_deleted
-            },
-            "warning": "⚠️ This action cannot be undone!"
-        }
+            # ✅ 6. Delete image from Cloudinary - external side effect, only after the commit
+            # Runs as a background task so the response doesn't wait on the Cloudinary API
+            cloudinary_deleted = False
+            public_id = _extract_cloudinary_public_id(dish) if dish.get("image_url") and CLOUDINARY_ENABLED else None
+            if public_id:
+                await _schedule_cloudinary_delete(background_tasks, public_id)
+                cloudinary_deleted = "pending"
+        
+            _invalidate_dish_cache(dish_id)
+            if recipe_oid:
+                invalidate_recipe_detail(str(recipe_oid))
+            logger.warning("PERMANENT DELETE: Dish %s permanently deleted by user %s", dish_id, user_id)
+        
+            return {
+                "message": "Dish permanently deleted",
+                "dish_id": dish_id,
+                "deleted_at": now,
+                "cleanup_summary": {
+                    "recipe_deleted": recipe_deleted,
+                    "comments_deleted": comments_deleted,
+                    "favorites_removed": favorites_removed,
+                    "activity_deleted": activity_deleted,
+                    "cloudinary_deleted": cloudinary_deleted
+                },
+                "warning": "⚠️ This action cannot be undone!"
+            }
         
-    except HTTPException:
-        raise
-    except Exception as e:
-        logging.error(f"Error permanently deleting dish {dish_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to permanently delete dish: {str(e)}")
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error("Error permanently deleting dish %s: %s", dish_id, e)
+            raise HTTPException(status_code=500, detail=f"Failed to permanently delete dish: {str(e)}")
 
 # ============= DYNAMIC ROUTES (MUST COME LAST) =============
 
-@router.get("/{dish_id}", response_model=DishDetailOut)
-async def get_dish_detail(dish_id: str):
+@router.get("/{dish_id}", response_model=DishDetailOut, response_class=ORJSONResponse)
+async def get_dish_detail(dish_id: ObjectIdStr):
     """
     Get single dish details by ID - SECURE VERSION
     """
     try:
-        # ✅ Validate ObjectId before using
-        dish_oid = _validate_object_id(dish_id, "dish_id")
+        cached = _dish_detail_cache.get(dish_id)
+        if cached is not None:
+            return ORJSONResponse(cached)
+        if _dish_not_found_cache.get(dish_id):
+            raise HTTPException(status_code=404, detail="Dish not found")
+        
+        dish_oid = ObjectId(dish_id)
         
         d = await dishes_collection.find_one({"_id": dish_oid})
         if not d:
+            _dish_not_found_cache.set(dish_id, True)
             raise HTTPException(status_code=404, detail="Dish not found")
-        return _to_detail_out(d)
+        
+        # ✅ Plain dict straight to orjson - no Pydantic serialization pass
+        result = _to_detail_dict(d)
+        _dish_detail_cache.set(dish_id, result)
+        return ORJSONResponse(result)
     except HTTPException:
         raise  # Re-raise HTTP exceptions
     except Exception as e:
-        logging.error(f"Error getting dish {dish_id}: {str(e)}")
+        logger.error("Error getting dish %s: %s", dish_id, e)
         raise HTTPException(status_code=404, detail="Dish not found")
 
-@router.get("/{dish_id}/with-recipe", response_model=DishWithRecipeDetailOut)
-async def get_dish_with_recipe(dish_id: str):
+@router.get("/{dish_id}/full", response_model=DishFullDetailOut, response_class=ORJSONResponse)
+async def get_dish_full(dish_id: ObjectIdStr):
+    """
+    Dish detail plus favorite and comment counts in a single aggregation round-trip
+    """
+    try:
+        if _dish_not_found_cache.get(dish_id):
+            raise HTTPException(status_code=404, detail="Dish not found")
+        
+        pipeline = [{"$match": {"_id": ObjectId(dish_id)}}, *_DISH_COUNTS_STAGES]
+        docs = await dishes_collection.aggregate(pipeline).to_list(1)
+        if not docs:
+            _dish_not_found_cache.set(dish_id, True)
+            raise HTTPException(status_code=404, detail="Dish not found")
+        
+        d = docs[0]
+        result = _to_detail_dict(d)
+        result["favorite_count"] = _joined_count(d, "_favorites")
+        result["comment_count"] = _joined_count(d, "_comments")
+        return ORJSONResponse(result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error getting full dish %s: %s", dish_id, e)
+        raise HTTPException(status_code=500, detail="Failed to load dish")
+
+@router.get("/{dish_id}/with-recipe", response_model=DishWithRecipeDetailOut, response_class=ORJSONResponse)
+async def get_dish_with_recipe(dish_id: ObjectIdStr):
     """
     Get dish with associated recipe details - SECURE VERSION
     """
     try:
-        # ✅ Validate ObjectId before using
-        dish_oid = _validate_object_id(dish_id, "dish_id")
+        cached = _dish_recipe_cache.get(dish_id)
+        if cached is not None:
+            return ORJSONResponse(cached)
+        if _dish_not_found_cache.get(dish_id):
+            raise HTTPException(status_code=404, detail="Dish not found")
         
-        dish = await dishes_collection.find_one({"_id": dish_oid})
-        if not dish:
+        dish_oid = ObjectId(dish_id)
+        
+        # ✅ Single round-trip: join the recipe server-side with $lookup
+        # (recipe_id is stored as a string; invalid ids convert to null and match nothing)
+        pipeline = [
+            {"$match": {"_id": dish_oid}},
+            {"$limit": 1},
+            {"$addFields": {"_recipe_oid": {
+                "$convert": {"input": "$recipe_id", "to": "objectId", "onError": None, "onNull": None}
+            }}},
+            {"$lookup": {
+                "from": recipe_collection.name,
+                "localField": "_recipe_oid",
+                "foreignField": "_id",
+                "as": "recipe_docs",
+            }},
+        ]
+        docs = await dishes_collection.aggregate(pipeline).to_list(length=1)
+        if not docs:
+            _dish_not_found_cache.set(dish_id, True)
             raise HTTPException(status_code=404, detail="Dish not found")
+        dish = docs[0]
         
         recipe = None
         recipe_id = dish.get("recipe_id")
         if recipe_id:
             try:
-                # ✅ Validate recipe ObjectId before using
-                if ObjectId.is_valid(recipe_id):
-                    r = await recipe_collection.find_one({"_id": ObjectId(recipe_id)})
-                    if r:
-                        # Create RecipeDetailOut and convert to dict for Pydantic validation
-                        recipe_obj = RecipeDetailOut(
-                            id=str(r["_id"]),
-                            name=r.get("name", ""),
-                            instructions=r.get("instructions", []),
-                            cooking_time=int(r.get("cooking_time", 0)),
-                            difficulty=r.get("difficulty", ""),
-                            serves=int(r.get("serves", 1)),
-                            creator_id=r.get("creator_id"),
-                            created_by=r.get("created_by"),
-                            dish_id=str(r.get("dish_id", "")),
-                            ratings=r.get("ratings", []),
-                            created_at=r.get("created_at"),
-                        )
-                        # Convert to dict for DishWithRecipeDetailOut validation
-                        recipe = recipe_obj.model_dump()
+                # Invalid recipe ids were already converted to null by the $lookup stage
+                r = dish["recipe_docs"][0] if dish.get("recipe_docs") else None
+                if r:
+                    # Plain dict in RecipeDetailOut shape - validated once by DishWithRecipeDetailOut
+                    recipe = {
+                        "id": str(r["_id"]),
+                        "name": r.get("name", ""),
+                        "description": r.get("description") or "",
+                        "ingredients": r.get("ingredients", []),
+                        "instructions": r.get("instructions", []),
+                        "cooking_time": int(r.get("cooking_time", 0)),
+                        "difficulty": r.get("difficulty", ""),
+                        "serves": int(r.get("serves", 1)),
+                        "creator_id": r.get("creator_id"),
+                        "created_by": r.get("created_by"),
+                        "dish_id": str(r.get("dish_id", "")),
+                        "ratings": r.get("ratings", []),
+                        "average_rating": float(r.get("average_rating") or 0.0),
+                        "image_url": r.get("image_url"),
+                        "created_at": r.get("created_at"),
+                    }
                 else:
-                    logging.warning(f"Invalid recipe_id format: {recipe_id} for dish: {dish_id}")
+                    logger.warning("Recipe %s not found or invalid id for dish: %s", recipe_id, dish_id)
             except Exception as recipe_e:
-                logging.warning(f"Failed to fetch recipe {recipe_id}: {str(recipe_e)}")
+                logger.warning("Failed to fetch recipe %s: %s", recipe_id, recipe_e)
                 # Continue without recipe if recipe fetch fails
         
-        return DishWithRecipeDetailOut(
+        # Validate once, cache the JSON-ready dict and hand it straight to orjson
+        result = DishWithRecipeDetailOut(
             dish=_to_detail_out(dish),
             recipe=recipe
-        )
+        ).model_dump(mode="json")
+        _dish_recipe_cache.set(dish_id, result)
+        return ORJSONResponse(result)
         
     except HTTPException:
         raise  # Re-raise HTTP exceptions
     except Exception as e:
-        logging.error(f"Error getting dish with recipe {dish_id}: {str(e)}")
+        logger.error("Error getting dish with recipe %s: %s", dish_id, e)
         raise HTTPException(status_code=404, detail="Dish not found")
 
 
 # ============= DELETE DISH WITH SOFT DELETE =============
 
 @router.delete("/{dish_id}")
-async def soft_delete_dish(dish_id: str, decoded=Depends(get_current_user)):
+async def soft_delete_dish(dish_id: ObjectIdStr, background_tasks: BackgroundTasks, decoded=Depends(get_current_user)):
     """
     Soft delete a dish (mark as deleted) with comprehensive cleanup
     
     ✅ Security: Only dish owner can delete
     ✅ Soft delete: Set deleted_at timestamp (allows recovery for 7 days)
     ✅ Cleanup: Remove from favorites, comments, user_activity
-    ✅ Cloudinary: Delete image from cloud storage
+    ✅ Cloudinary: Delete image from cloud storage (background task)
     ✅ Logging: Audit trail for deletion
     
     After 7 days, use /admin/cleanup-deleted endpoint to permanently delete
     """
-    try:
-        # ✅ 1. Validate dish ID
-        dish_oid = _validate_object_id(dish_id, "dish_id")
-        
-        # ✅ 2. Get dish and verify ownership
-        dish = await dishes_collection.find_one({"_id": dish_oid})
-        if not dish:
-            raise HTTPException(status_code=404, detail="Dish not found")
-        
-        # Check if already deleted
-        if dish.get("deleted_at"):
-            raise HTTPException(status_code=400, detail="Dish already deleted")
-        
-        # ✅ 3. Verify ownership - CRITICAL SECURITY CHECK
-        user_email = extract_user_email(decoded)
-        user = await get_user_by_email(user_email, decoded)
-        user_id = str(user["_id"])
-        
-        if dish.get("creator_id") != user_id:
-            logging.warning(f"Unauthorized delete attempt: User {user_id} tried to delete dish {dish_id} owned by {dish.get('creator_id')}")
-            raise HTTPException(
-                status_code=403, 
-                detail="You can only delete your own dishes"
+    async with _dish_operation_lock(dish_id):
+        try:
+            user_email = extract_user_email(decoded)
+            now = datetime.now(timezone.utc)
+        
+            # ✅ 2-4. Resolve current user and soft delete dish - mark as deleted
+            # CRITICAL SECURITY CHECK: ownership + not-yet-deleted are part of the update filter
+            dish, user_id, dish_oid = await _authorize_and_load(
+                dish_id, decoded,
+                lambda guard, user_id: dishes_collection.find_one_and_update(
+                    guard,
+                    # favorite_count drops to 0 with it - the cleanup below pulls the dish from every favorites list
+                    {"$set": {"deleted_at": now, "deleted_by": user_id, "updated_at": now, "favorite_count": 0}},
+                    projection=_DISH_CLEANUP_PROJECTION,
+                    return_document=ReturnDocument.BEFORE
+                ),
+                require_deleted=False, state_error="Dish already deleted", action="delete",
             )
         
-        now = datetime.now(timezone.utc)
+            _invalidate_dish_cache(dish_id)
+            logger.info("Dish %s soft deleted by user %s at %s", dish_id, user_id, now)
+        
+            dish_refs = _dish_refs(dish_id, dish_oid)
+        
+            # ✅ 5-9. Cleanup steps touch independent collections/services - run them concurrently
+            ops = {
+                # Remove from all users' favorites
+                "favorites": users_collection.update_many(
+                    {"favorite_dishes": dish_refs},
+                    {"$pull": {"favorite_dishes": dish_refs}, "$inc": {"favorites_version": 1}}
+                ),
+                # Remove from user_activity (viewed_dishes_and_users)
+                "activity": user_activity_col.update_many(
+                    {"viewed_dishes_and_users.id": dish_refs},
+                    {"$pull": {"viewed_dishes_and_users": {"type": "dish", "id": dish_refs}}}
+                ),
+                # Soft delete all comments (mark as deleted)
+                "comments": comments_collection.update_many(
+                    {"dish_id": dish_refs, "deleted_at": {"$exists": False}},
+                    {"$set": {"deleted_at": now, "deleted_by": user_id}}
+                ),
+            }
+            # Delete associated recipe (if exists)
+            recipe_oid = _to_object_id(dish.get("recipe_id"))
+            if recipe_oid:
+                ops["recipe"] = recipe_collection.delete_one({"_id": recipe_oid})
+            # Delete Cloudinary image (if exists) - queued, runs after the response is sent
+            public_id = _extract_cloudinary_public_id(dish) if CLOUDINARY_ENABLED else None
+            if public_id:
+                ops["cloudinary"] = _schedule_cloudinary_delete(background_tasks, public_id)
+            elif CLOUDINARY_ENABLED:
+                logger.warning("No public_id found for dish %s", dish_id)
+        
+            results = await _run_cleanup(ops)
+            if recipe_oid:
+                invalidate_recipe_detail(str(recipe_oid))  # After the delete, so a concurrent GET can't re-cache it
+            # Favorites/activity/comments cleanup is required; recipe and image failures are tolerated
+            for step in ("favorites", "activity", "comments"):
+                if isinstance(results[step], Exception):
+                    raise results[step]
+        
+            favorites_removed_count = results["favorites"].modified_count
+            activity_removed_count = results["activity"].modified_count
+            comments_deleted_count = results["comments"].modified_count
+            recipe_deleted = _result_count(results.get("recipe"), "deleted_count") > 0
+            cloudinary_queued = public_id is not None and not isinstance(results.get("cloudinary"), Exception)
+            cloudinary_deleted = "pending" if cloudinary_queued else False
+            image_info = {"public_id": public_id, "result": "pending"} if cloudinary_queued else None
+        
+            logger.info(
+                "Dish %s cleanup: %s favorites, %s view history entries, %s comments removed",
+                dish_id, favorites_removed_count, activity_removed_count, comments_deleted_count
+            )
         
-        # ✅ 4. Soft delete dish - mark as deleted
-        await dishes_collection.update_one(
-            {"_id": dish_oid},
-            {
-                "$set": {
-                    "deleted_at": now,
-                    "deleted_by": user_id,
-                    "updated_at": now
+            # ✅ 10. Audit log - persisted to audit_logs without waiting for the server ack
+            audit_log = {
+                "action": "dish_soft_delete",
+                "dish_id": dish_id,
+                "dish_name": dish.get("name", ""),
+                "user_id": user_id,
+                "user_email": user_email,
+                "timestamp": now,
+                "cleanup_stats": {
+                    "favorites_removed": favorites_removed_count,
+                    "activity_removed": activity_removed_count,
+                    "comments_deleted": comments_deleted_count,
+                    "recipe_deleted": recipe_deleted,
+                    "cloudinary_deleted": cloudinary_deleted,
+                    "image_info": image_info
                 }
             }
-        )
-        
-        logging.info(f"Dish {dish_id} soft deleted by user {user_id} at {now}")
-        
-        # ✅ 5. Delete Cloudinary image (if exists)
-        cloudinary_deleted = False
-        image_info = None
-        
-        if CLOUDINARY_ENABLED:
-            try:
-                # Try to extract public_id from image_url or use stored public_id
-                public_id = dish.get("image_public_id")  # If stored separately
-                
-                if not public_id and dish.get("image_url"):
-                    # Extract public_id from Cloudinary URL
-                    # URL format: https://res.cloudinary.com/<cloud>/image/upload/v<version>/<public_id>
-                    image_url = dish.get("image_url", "")
-                    if "cloudinary.com" in image_url:
-                        parts = image_url.split("/")
-                        if len(parts) >= 2:
-                            # Get last part and remove extension
-                            filename = parts[-1].split(".")[0]
-                            folder = parts[-2] if len(parts) >= 3 else "dishes"
-                            public_id = f"{folder}/{filename}"
-                
-                if public_id:
-                    result = cloudinary.uploader.destroy(public_id)
-                    cloudinary_deleted = (result.get("result") == "ok")
-                    image_info = {"public_id": public_id, "result": result}
-                    logging.info(f"Cloudinary image deleted: {public_id}, result: {result}")
-                else:
-                    logging.warning(f"No public_id found for dish {dish_id}")
-                    
-            except Exception as e:
-                logging.error(f"Failed to delete Cloudinary image for dish {dish_id}: {str(e)}")
-                # Continue even if image deletion fails
-        
-        # ✅ 6. Remove from all users' favorites
-        favorite_removal_result = await users_collection.update_many(
-            {"favorite_dishes": dish_id},
-            {"$pull": {"favorite_dishes": dish_id}}
-        )
-        favorites_removed_count = favorite_removal_result.modified_count
-        
-        logging.info(f"Removed dish {dish_id} from {favorites_removed_count} users' favorites")
-        
-        # ✅ 7. Remove from user_activity (viewed_dishes_and_users)
-        activity_removal_result = await user_activity_col.update_many(
-            {"viewed_dishes_and_users.id": dish_id},
-            {"$pull": {"viewed_dishes_and_users": {"type": "dish", "id": dish_id}}}
-        )
-        activity_removed_count = activity_removal_result.modified_count
-        
-        logging.info(f"Removed dish {dish_id} from {activity_removed_count} users' view history")
-        
-        # ✅ 8. Soft delete all comments (mark as deleted)
-        comments_deletion_result = await comments_collection.update_many(
-            {"dish_id": dish_id, "deleted_at": {"$exists": False}},
-            {"$set": {"deleted_at": now, "deleted_by": user_id}}
-        )
-        comments_deleted_count = comments_deletion_result.modified_count
-        
-        logging.info(f"Soft deleted {comments_deleted_count} comments for dish {dish_id}")
-        
-        # ✅ 9. Delete associated recipe (if exists)
-        recipe_deleted = False
-        recipe_id = dish.get("recipe_id")
-        if recipe_id and ObjectId.is_valid(recipe_id):
-            try:
-                recipe_deletion_result = await recipe_collection.delete_one(
-                    {"_id": ObjectId(recipe_id)}
-                )
-                recipe_deleted = (recipe_deletion_result.deleted_count > 0)
-                logging.info(f"Deleted recipe {recipe_id} for dish {dish_id}")
-            except Exception as e:
-                logging.error(f"Failed to delete recipe {recipe_id}: {str(e)}")
-        
-        # ✅ 10. Audit log
-        audit_log = {
-            "action": "dish_soft_delete",
-            "dish_id": dish_id,
-            "dish_name": dish.get("name", ""),
-            "user_id": user_id,
-            "user_email": user_email,
-            "timestamp": now,
-            "cleanup_stats": {
-                "favorites_removed": favorites_removed_count,
-                "activity_removed": activity_removed_count,
-                "comments_deleted": comments_deleted_count,
-                "recipe_deleted": recipe_deleted,
-                "cloudinary_deleted": cloudinary_deleted,
-                "image_info": image_info
+            _emit_audit_log(audit_log)
+        
+            # ✅ 11. Return success response
+            return {
+                "success": True,
+                "message": "Dish soft deleted successfully",
+                "dish_id": dish_id,
+                "deleted_at": now,
+                "recovery_deadline": now + timedelta(days=7),
+                "cleanup_summary": {
+                    "favorites_removed": favorites_removed_count,
+                    "activity_removed": activity_removed_count,
+                    "comments_deleted": comments_deleted_count,
+                    "recipe_deleted": recipe_deleted,
+                    "cloudinary_deleted": cloudinary_deleted
+                },
+                "note": "This dish can be recovered within 7 days. After that, it will be permanently deleted by cleanup job."
             }
-        }
-        
-        logging.info(f"Dish deletion audit: {audit_log}")
         
-        # ✅ 11. Return success response
-        return {
-            "success": True,
-            "message": "Dish soft deleted successfully",
-            "dish_id": dish_id,
-            "deleted_at": now.isoformat(),
-            "recovery_deadline": (now + timedelta(days=7)).isoformat(),
-            "cleanup_summary": {
-                "favorites_removed": favorites_removed_count,
-                "activity_removed": activity_removed_count,
-                "comments_deleted": comments_deleted_count,
-                "recipe_deleted": recipe_deleted,
-                "cloudinary_deleted": cloudinary_deleted
-            },
-            "note": "This dish can be recovered within 7 days. After that, it will be permanently deleted by cleanup job."
-        }
-        
-    except HTTPException:
-        raise  # Re-raise HTTP exceptions
-    except Exception as e:
-        logging.error(f"Error deleting dish {dish_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to delete dish: {str(e)}")
+        except HTTPException:
+            raise  # Re-raise HTTP exceptions
+        except Exception as e:
+            logger.error("Error deleting dish %s: %s", dish_id, e)
+            raise HTTPException(status_code=500, detail=f"Failed to delete dish: {str(e)}")
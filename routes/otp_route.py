@@ -4,11 +4,12 @@ Tích hợp vào backend FastAPI hiện tại
 """
 from pydantic import BaseModel, EmailStr
 from typing import Literal, Optional
-from fastapi import APIRouter, HTTPException, Depends
-from datetime import datetime, timezone, timedelta
-import random
-import string
-import json
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from datetime import datetime, timezone
+import os
+import secrets
+import time
+import asyncio
 
 from email_service import send_otp_email  # Service gửi email
 from core.auth.dependencies import get_current_user
@@ -22,6 +23,26 @@ def get_redis_client():
     from main_async import redis_client
     return redis_client
 
+async def ensure_otp_indexes():
+    """
+    Unique index on users.email - the /send existence check becomes an index-only lookup
+    Partial on string emails so users without one don't collide on null
+    Set SKIP_INDEX_ENSURE=1 where indexes are provisioned by migration
+    """
+    if os.getenv("SKIP_INDEX_ENSURE") == "1":
+        return
+    
+    from main_async import users_col
+    try:
+        await users_col.create_index(
+            "email",
+            unique=True,
+            partialFilterExpression={"email": {"$type": "string"}}
+        )
+        print("✅ OTP indexes created successfully")
+    except Exception as e:
+        print(f"⚠️ OTP index creation failed (duplicate emails or already exists): {e}")
+
 # ==================== PYDANTIC MODELS ====================
 
 class OTPSendRequest(BaseModel):
@@ -53,76 +74,95 @@ class OTPVerifyResponse(BaseModel):
 OTP_EXPIRY_MINUTES = 10
 MAX_OTP_ATTEMPTS = 3
 OTP_LENGTH = 6
+EMAIL_SEND_ATTEMPTS = 3
+EMAIL_RETRY_BASE_DELAY = 1  # seconds, doubled after each failed attempt
+
+# Disposable email providers - rejected outright
+DISPOSABLE_DOMAINS = frozenset({
+    "10minutemail.com", "tempmail.org", "guerrillamail.com",
+    "mailinator.com", "yopmail.com", "temp-mail.org",
+    "throwaway.email", "10minuteemail.com", "temp-mail.io"
+})
+
+# Common domain typos -> suggested correction
+DOMAIN_CORRECTIONS = {
+    "gmai.com": "gmail.com",
+    "gmial.com": "gmail.com", 
+    "gmail.co": "gmail.com",
+    "yahooo.com": "yahoo.com",
+    "hotmial.com": "hotmail.com",
+}
 
 # ==================== HELPER FUNCTIONS ====================
 
 def generate_otp() -> str:
-    """Generate 6-digit OTP"""
-    return ''.join(random.choices(string.digits, k=OTP_LENGTH))
+    """Generate 6-digit OTP (CSPRNG - OTPs must not be predictable)"""
+    return f"{secrets.randbelow(10 ** OTP_LENGTH):0{OTP_LENGTH}d}"
 
 def generate_otp_id() -> str:
     """Generate unique OTP session ID"""
-    timestamp = str(int(datetime.now().timestamp()))
-    random_part = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
-    return f"otp_{timestamp}_{random_part}"
+    return f"otp_{int(time.time())}_{secrets.token_hex(4)}"
 
-async def validate_email_advanced(email: str) -> dict:
+def validate_email_advanced(email: str) -> dict:
     """
     Advanced email validation
     Returns: {"valid": bool, "reason": str}
+    
+    Pure in-memory lookups - plain function, no coroutine needed
     """
     # Basic format validation đã được Pydantic EmailStr handle
+    domain = email.rpartition('@')[2].lower()
     
     # Check disposable email domains
-    disposable_domains = {
-        "10minutemail.com", "tempmail.org", "guerrillamail.com",
-        "mailinator.com", "yopmail.com", "temp-mail.org",
-        "throwaway.email", "10minuteemail.com", "temp-mail.io"
-    }
-    
-    domain = email.split('@')[1].lower()
-    
-    if domain in disposable_domains:
+    if domain in DISPOSABLE_DOMAINS:
         return {"valid": False, "reason": "Email tạm thời không được phép"}
     
     # Check common typos
-    domain_corrections = {
-        "gmai.com": "gmail.com",
-        "gmial.com": "gmail.com", 
-        "gmail.co": "gmail.com",
-        "yahooo.com": "yahoo.com",
-        "hotmial.com": "hotmail.com",
-    }
-    
-    if domain in domain_corrections:
-        suggested = email.replace(domain, domain_corrections[domain])
+    if domain in DOMAIN_CORRECTIONS:
+        suggested = email.replace(domain, DOMAIN_CORRECTIONS[domain])
         return {"valid": False, "reason": f"Có phải bạn muốn dùng {suggested}?"}
     
     return {"valid": True, "reason": ""}
 
+# OTP state lives in a Redis hash "otp:{id}" - fields: otp, email, purpose,
+# expires_at (unix seconds), attempts, max_attempts, created_at, resent_at
+_OTP_INT_FIELDS = ("expires_at", "attempts", "max_attempts", "created_at", "resent_at")
+
 async def store_otp_redis(otp_id: str, otp_data: dict) -> bool:
-    """Store OTP data in Redis with expiry"""
+    """
+    Store OTP data in Redis with expiry
+    Only the given fields are written (HSET merges) - pass just what changed
+    """
     try:
         redis = get_redis_client()
         key = f"otp:{otp_id}"
-        value = json.dumps(otp_data, default=str)
         expiry_seconds = OTP_EXPIRY_MINUTES * 60
         
-        await redis.setex(key, expiry_seconds, value)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping=otp_data)
+            pipe.expire(key, expiry_seconds)
+            await pipe.execute()
         return True
     except Exception as e:
         print(f"Redis store error: {e}")
         return False
 
+def _parse_otp_hash(otp_data: dict) -> Optional[dict]:
+    """HGETALL result -> OTP dict (None if missing)"""
+    if not otp_data:
+        return None
+    # Hash values come back as strings - cast the numeric fields at the boundary
+    for field in _OTP_INT_FIELDS:
+        if field in otp_data:
+            otp_data[field] = int(otp_data[field])
+    return otp_data
+
 async def get_otp_redis(otp_id: str) -> Optional[dict]:
     """Get OTP data from Redis"""
     try:
         redis = get_redis_client()
         key = f"otp:{otp_id}"
-        value = await redis.get(key)
-        if value:
-            return json.loads(value)
-        return None
+        return _parse_otp_hash(await redis.hgetall(key))
     except Exception as e:
         print(f"Redis get error: {e}")
         return None
@@ -138,28 +178,148 @@ async def delete_otp_redis(otp_id: str) -> bool:
         print(f"Redis delete error: {e}")
         return False
 
+async def deliver_otp_email(email: str, otp_code: str, purpose: str):
+    """
+    Background task: send the OTP email, retrying with exponential backoff
+    The response has already been returned - on final failure the user can resend
+    """
+    delay = EMAIL_RETRY_BASE_DELAY
+    for attempt in range(1, EMAIL_SEND_ATTEMPTS + 1):
+        if await send_otp_email(
+            email=email,
+            otp_code=otp_code,
+            purpose=purpose,
+            expires_minutes=OTP_EXPIRY_MINUTES
+        ):
+            return
+        if attempt < EMAIL_SEND_ATTEMPTS:
+            await asyncio.sleep(delay)
+            delay *= 2
+    print(f"❌ OTP email to {email} failed after {EMAIL_SEND_ATTEMPTS} attempts")
+
+# ==================== OTP VERIFICATION (ATOMIC) ====================
+
+# Load, compare, count the attempt and delete in one atomic Redis call
+# KEYS[1] = otp:{id}; ARGV = otp, email, now (unix seconds)
+# Returns {status, remaining_attempts, purpose}
+VERIFY_OTP_LUA = """
+local otp = redis.call('HMGET', KEYS[1], 'otp', 'email', 'purpose', 'expires_at', 'attempts', 'max_attempts')
+if not otp[1] then
+    return {'missing', 0, ''}
+end
+if otp[2] ~= ARGV[2] then
+    return {'email_mismatch', 0, ''}
+end
+if tonumber(otp[4]) < tonumber(ARGV[3]) then
+    redis.call('DEL', KEYS[1])
+    return {'expired', 0, ''}
+end
+local max_attempts = tonumber(otp[6])
+if tonumber(otp[5]) >= max_attempts then
+    redis.call('DEL', KEYS[1])
+    return {'exhausted', 0, ''}
+end
+if otp[1] ~= ARGV[1] then
+    local remaining = max_attempts - redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+    if remaining <= 0 then
+        redis.call('DEL', KEYS[1])
+    end
+    return {'wrong', remaining, ''}
+end
+redis.call('DEL', KEYS[1])
+return {'ok', 0, otp[3]}
+"""
+
+_verify_script = None
+
+async def _verify_otp_local(redis, key: str, otp: str, email: str, now: int) -> list:
+    """Same steps as VERIFY_OTP_LUA for clients without scripting (InMemoryRedis in development)"""
+    otp_data = await redis.hgetall(key)
+    if not otp_data:
+        return ["missing", 0, ""]
+    if otp_data["email"] != email:
+        return ["email_mismatch", 0, ""]
+    if int(otp_data["expires_at"]) < now:
+        await redis.delete(key)
+        return ["expired", 0, ""]
+    max_attempts = int(otp_data["max_attempts"])
+    if int(otp_data["attempts"]) >= max_attempts:
+        await redis.delete(key)
+        return ["exhausted", 0, ""]
+    if otp_data["otp"] != otp:
+        remaining = max_attempts - await redis.hincrby(key, "attempts", 1)
+        if remaining <= 0:
+            await redis.delete(key)
+        return ["wrong", remaining, ""]
+    await redis.delete(key)
+    return ["ok", 0, otp_data["purpose"]]
+
+async def verify_otp_atomic(otp_id: str, otp: str, email: str) -> list:
+    """
+    Verify an OTP in a single round-trip (EVALSHA)
+    Concurrent verify calls can't both read the same attempts count
+    """
+    global _verify_script
+    redis = get_redis_client()
+    key = f"otp:{otp_id}"
+    now = int(time.time())
+    
+    if not hasattr(redis, "register_script"):
+        return await _verify_otp_local(redis, key, otp, email, now)
+    
+    if _verify_script is None:
+        _verify_script = redis.register_script(VERIFY_OTP_LUA)
+    return await _verify_script(keys=[key], args=[otp, email, now])
+
 # ==================== RATE LIMITING ====================
 
+# Token bucket per (action, email): RATE_LIMIT_CAPACITY requests burst, refilled at
+# RATE_LIMIT_CAPACITY per RATE_LIMIT_REFILL_SECONDS - no double burst at window edges
+RATE_LIMIT_CAPACITY = 5
+RATE_LIMIT_REFILL_SECONDS = 60
+
+# KEYS[1] = rl:{action}:{email}; ARGV = capacity, refill_per_second, now (unix seconds)
+# Returns {allowed (0/1), tokens_left}
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_rate))
+return {allowed, math.floor(tokens)}
+"""
+
+_bucket_script = None
+
 async def check_rate_limit(email: str, action: str) -> bool:
     """
     Check rate limiting for OTP actions
     Returns True if allowed, False if rate limited
+    
+    ✅ Atomic token bucket in one round-trip (Lua) - correct across workers
     """
-    key = f"rate_limit:{action}:{email}"
+    global _bucket_script
     try:
         redis = get_redis_client()
-        count = await redis.get(key)
-        if count is None:
-            # First request
-            await redis.setex(key, 60, "1")  # 1 minute window
-            return True
-        
-        current_count = int(count)
-        if current_count >= 5:  # Max 5 requests per minute
-            return False
+        key = f"rl:{action}:{email}"
+        args = [RATE_LIMIT_CAPACITY, RATE_LIMIT_CAPACITY / RATE_LIMIT_REFILL_SECONDS, time.time()]
         
-        await redis.incr(key)
-        return True
+        if not hasattr(redis, "register_script"):
+            allowed, _ = await redis.token_bucket(key, *args)  # InMemoryRedis runs the same bucket in Python
+        else:
+            if _bucket_script is None:
+                _bucket_script = redis.register_script(TOKEN_BUCKET_LUA)
+            allowed, _ = await _bucket_script(keys=[key], args=args)
+        return bool(allowed)
     except Exception as e:
         print(f"Rate limit check error: {e}")
         return True  # Allow on error
@@ -167,7 +327,7 @@ async def check_rate_limit(email: str, action: str) -> bool:
 # ==================== OTP ROUTES ====================
 
 @otp_router.post("/send", response_model=OTPResponse)
-async def send_otp_email_route(request: OTPSendRequest):
+async def send_otp_email_route(request: OTPSendRequest, background_tasks: BackgroundTasks):
     """
     Gửi OTP qua email
     """
@@ -175,21 +335,21 @@ async def send_otp_email_route(request: OTPSendRequest):
         # Import here to avoid circular import
         from main_async import users_col
         
-        # Rate limiting
+        # Advanced email validation
+        validation = validate_email_advanced(request.email)
+        if not validation["valid"]:
+            raise HTTPException(status_code=400, detail=validation["reason"])
+        
+        # ✅ Rate limit first - a throttled caller costs one Redis call, no Mongo lookup or OTP write
         if not await check_rate_limit(request.email, "send_otp"):
             raise HTTPException(
                 status_code=429, 
                 detail="Quá nhiều yêu cầu. Vui lòng thử lại sau."
             )
         
-        # Advanced email validation
-        validation = await validate_email_advanced(request.email)
-        if not validation["valid"]:
-            raise HTTPException(status_code=400, detail=validation["reason"])
-        
         # Check if user exists for register purpose
         if request.purpose == "register":
-            existing_user = await users_col.find_one({"email": request.email})
+            existing_user = await users_col.find_one({"email": request.email}, {"_id": 1})
             if existing_user:
                 raise HTTPException(
                     status_code=400,
@@ -197,7 +357,7 @@ async def send_otp_email_route(request: OTPSendRequest):
                 )
         elif request.purpose == "login":
             # For login, user should exist
-            existing_user = await users_col.find_one({"email": request.email})
+            existing_user = await users_col.find_one({"email": request.email}, {"_id": 1})
             if not existing_user:
                 raise HTTPException(
                     status_code=404,
@@ -207,17 +367,17 @@ async def send_otp_email_route(request: OTPSendRequest):
         # Generate OTP and session ID
         otp_code = generate_otp()
         otp_id = generate_otp_id()
-        expires_at = datetime.now(timezone.utc) + timedelta(minutes=OTP_EXPIRY_MINUTES)
+        now = int(time.time())
         
         # Store OTP data
         otp_data = {
             "otp": otp_code,
             "email": request.email,
             "purpose": request.purpose,
-            "expires_at": expires_at.isoformat(),
+            "expires_at": now + OTP_EXPIRY_MINUTES * 60,
             "attempts": 0,
             "max_attempts": MAX_OTP_ATTEMPTS,
-            "created_at": datetime.now(timezone.utc).isoformat()
+            "created_at": now
         }
         
         if not await store_otp_redis(otp_id, otp_data):
@@ -226,21 +386,8 @@ async def send_otp_email_route(request: OTPSendRequest):
                 detail="Không thể lưu OTP. Vui lòng thử lại."
             )
         
-        # Send email
-        email_sent = await send_otp_email(
-            email=request.email,
-            otp_code=otp_code,
-            purpose=request.purpose,
-            expires_minutes=OTP_EXPIRY_MINUTES
-        )
-        
-        if not email_sent:
-            # Clean up on email failure
-            await delete_otp_redis(otp_id)
-            raise HTTPException(
-                status_code=500,
-                detail="Không thể gửi email. Vui lòng thử lại."
-            )
+        # ✅ Send email after the response - OTP is already stored, /resend covers delivery failures
+        background_tasks.add_task(deliver_otp_email, request.email, otp_code, request.purpose)
         
         return OTPResponse(
             success=True,
@@ -264,65 +411,48 @@ async def verify_otp_route(request: OTPVerifyRequest):
     Xác thực OTP
     """
     try:
-        # Get OTP data
-        otp_data = await get_otp_redis(request.otp_id)
-        if not otp_data:
+        # ✅ Check existence, email, expiry, attempts and the code in one atomic Redis call
+        status, remaining, purpose = await verify_otp_atomic(request.otp_id, request.otp, request.email)
+        remaining = int(remaining)
+        
+        if status == "missing":
             raise HTTPException(
                 status_code=400,
                 detail="Mã OTP không tồn tại hoặc đã hết hạn"
             )
-        
-        # Check email match
-        if otp_data["email"] != request.email:
+        if status == "email_mismatch":
             raise HTTPException(
                 status_code=400,
                 detail="Email không khớp với OTP"
             )
-        
-        # Check expiry
-        expires_at = datetime.fromisoformat(otp_data["expires_at"])
-        if datetime.now(timezone.utc) > expires_at:
-            await delete_otp_redis(request.otp_id)
+        if status == "expired":
             raise HTTPException(
                 status_code=400,
                 detail="Mã OTP đã hết hạn"
             )
-        
-        # Check attempts
-        if otp_data["attempts"] >= otp_data["max_attempts"]:
-            await delete_otp_redis(request.otp_id)
+        if status == "exhausted":
             raise HTTPException(
                 status_code=400,
                 detail="Đã vượt quá số lần thử tối đa"
             )
-        
-        # Verify OTP
-        if otp_data["otp"] != request.otp:
-            # Increment attempts
-            otp_data["attempts"] += 1
-            await store_otp_redis(request.otp_id, otp_data)
-            
-            remaining = otp_data["max_attempts"] - otp_data["attempts"]
+        if status == "wrong":
             if remaining <= 0:
-                await delete_otp_redis(request.otp_id)
                 raise HTTPException(
                     status_code=400,
                     detail="Mã OTP không đúng. Đã hết lượt thử."
                 )
-            else:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Mã OTP không đúng. Còn {remaining} lần thử"
-                )
+            raise HTTPException(
+                status_code=400,
+                detail=f"Mã OTP không đúng. Còn {remaining} lần thử"
+            )
         
-        # OTP verified successfully
-        await delete_otp_redis(request.otp_id)
+        # OTP verified successfully (the script already deleted it)
         
         # For register purpose, we'll return success and let frontend create Firebase account
         # For login purpose, we could generate a custom Firebase token here
         
         firebase_token = None
-        if otp_data["purpose"] == "login":
+        if purpose == "login":
             # TODO: Generate Firebase custom token for passwordless login
             # This requires Firebase Admin SDK setup
             firebase_token = "custom_token_placeholder"
@@ -343,7 +473,7 @@ async def verify_otp_route(request: OTPVerifyRequest):
         )
 
 @otp_router.post("/resend", response_model=OTPResponse)
-async def resend_otp_route(request: OTPResendRequest):
+async def resend_otp_route(request: OTPResendRequest, background_tasks: BackgroundTasks):
     """
     Gửi lại OTP
     """
@@ -355,16 +485,17 @@ async def resend_otp_route(request: OTPResendRequest):
                 detail="Quá nhiều yêu cầu. Vui lòng thử lại sau."
             )
         
-        # Get existing OTP data
-        otp_data = await get_otp_redis(request.otp_id)
-        if not otp_data:
+        # Get existing OTP session - only the fields this route needs
+        redis = get_redis_client()
+        email, purpose = await redis.hmget(f"otp:{request.otp_id}", "email", "purpose")
+        if email is None:
             raise HTTPException(
                 status_code=400,
                 detail="Phiên OTP không tồn tại. Vui lòng yêu cầu OTP mới."
             )
         
         # Check email match
-        if otp_data["email"] != request.email:
+        if email != request.email:
             raise HTTPException(
                 status_code=400,
                 detail="Email không khớp với phiên OTP"
@@ -372,36 +503,22 @@ async def resend_otp_route(request: OTPResendRequest):
         
         # Generate new OTP
         new_otp = generate_otp()
-        new_expires_at = datetime.now(timezone.utc) + timedelta(minutes=OTP_EXPIRY_MINUTES)
+        now = int(time.time())
         
-        # Update OTP data
-        otp_data.update({
+        # Store updated fields (email, purpose, max_attempts, created_at stay as they are)
+        if not await store_otp_redis(request.otp_id, {
             "otp": new_otp,
-            "expires_at": new_expires_at.isoformat(),
+            "expires_at": now + OTP_EXPIRY_MINUTES * 60,
             "attempts": 0,  # Reset attempts
-            "resent_at": datetime.now(timezone.utc).isoformat()
-        })
-        
-        # Store updated data
-        if not await store_otp_redis(request.otp_id, otp_data):
+            "resent_at": now
+        }):
             raise HTTPException(
                 status_code=500,
                 detail="Không thể cập nhật OTP. Vui lòng thử lại."
             )
         
-        # Send new email
-        email_sent = await send_otp_email(
-            email=request.email,
-            otp_code=new_otp,
-            purpose=otp_data["purpose"],
-            expires_minutes=OTP_EXPIRY_MINUTES
-        )
-        
-        if not email_sent:
-            raise HTTPException(
-                status_code=500,
-                detail="Không thể gửi email. Vui lòng thử lại."
-            )
+        # Send new email (background, with retries)
+        background_tasks.add_task(deliver_otp_email, request.email, new_otp, purpose)
         
         return OTPResponse(
             success=True,
@@ -441,20 +558,29 @@ async def otp_health_check():
 
 @otp_router.get("/debug/{otp_id}")
 async def debug_otp(otp_id: str):
-    """Debug endpoint - kiểm tra OTP có tồn tại không"""
+    """Debug endpoint - kiểm tra OTP có tồn tại không (kèm trạng thái Redis)"""
     try:
-        otp_data = await get_otp_redis(otp_id)
+        # ✅ Redis health + OTP lookup in one round-trip
+        redis = get_redis_client()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.ping()
+            pipe.hgetall(f"otp:{otp_id}")
+            pong, raw = await pipe.execute()
+        redis_status = "connected" if pong else "disconnected"
+        
+        otp_data = _parse_otp_hash(raw)
         if otp_data:
             # Ẩn OTP code thật để bảo mật
-            debug_data = otp_data.copy()
-            debug_data["otp"] = "***HIDDEN***"
+            otp_data["otp"] = "***HIDDEN***"
             return {
                 "found": True,
-                "data": debug_data
+                "redis": redis_status,
+                "data": otp_data
             }
         else:
             return {
                 "found": False,
+                "redis": redis_status,
                 "message": "OTP không tồn tại hoặc đã hết hạn"
             }
     except Exception as e:
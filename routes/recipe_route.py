@@ -2,17 +2,18 @@
 Recipe Management Routes - Simplified Main Router
 All handlers moved to utils.recipe_handlers for better organization
 """
-from fastapi import APIRouter, Depends, Body
-from models.recipe_model import RecipeIn, RecipeOut, RatingRequest
+from fastapi import APIRouter, Depends, Body, Response
+from models.recipe_model import RecipeIn, RecipeOut, RecipeListItemOut, RatingRequest, BulkRatingRequest
 from core.auth.dependencies import get_current_user
 from utils.recipe_handlers import (
     create_recipe_handler,
     get_all_recipes_handler,
     get_recipe_handler,
     get_recipes_by_user_handler,
-    rate_recipe_handler
+    rate_recipe_handler,
+    rate_recipes_bulk_handler
 )
-from typing import List
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -21,11 +22,15 @@ router = APIRouter()
 async def create_recipe(recipe: RecipeIn, decoded=Depends(get_current_user)):
     return await create_recipe_handler(recipe, decoded)
 
-@router.get("/", response_model=List[RecipeOut])
-async def get_all_recipes(skip: int = 0, limit: int = 20):
-    return await get_all_recipes_handler(skip, limit)
+@router.get("/", response_model=List[RecipeListItemOut])
+async def get_all_recipes(response: Response, skip: int = 0, limit: int = 20, after_id: Optional[str] = None):
+    recipes = await get_all_recipes_handler(skip, limit, after_id)
+    # Next page cursor - pass back as after_id to paginate without server-side skip
+    if recipes:
+        response.headers["X-Next-Cursor"] = recipes[-1].id
+    return recipes
 
-@router.get("/by-user", response_model=List[RecipeOut])
+@router.get("/by-user", response_model=List[RecipeListItemOut])
 async def get_recipes_by_user(decoded=Depends(get_current_user)):
     return await get_recipes_by_user_handler(decoded)
 
@@ -39,3 +44,10 @@ async def rate_recipe(recipe_id: str, rating_request: RatingRequest, decoded=Dep
     Rate a recipe (1-5 stars) - Uses request body for better security
     """
     return await rate_recipe_handler(recipe_id, rating_request.rating, decoded)
+
+@router.post("/rate-bulk")
+async def rate_recipes_bulk(rating_request: BulkRatingRequest, decoded=Depends(get_current_user)):
+    """
+    Rate several recipes (1-5 stars each) in one request
+    """
+    return await rate_recipes_bulk_handler(rating_request.ratings, decoded)
@@ -3,14 +3,91 @@
 # Simplified: keep only a paginated /trending feed sorted by rating desc then recency.
 """
 
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Response
 from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
+import logging
+import math
+import os
+import asyncio
+import orjson
 
-from database.mongo import get_database
+from database.mongo import get_database, dishes_collection
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+# ✅ Short-lived Redis cache for /trending (feed changes slowly; shared across workers)
+TRENDING_CACHE_TTL = 45  # seconds
+
+
+def get_redis_client():
+    """Get Redis client from main_async (set during startup)"""
+    from main_async import redis_client
+    return redis_client
+
+
+async def _cache_get(key: str) -> Optional[str]:
+    """Read a cached value - a Redis failure is treated as a miss"""
+    try:
+        return await get_redis_client().get(key)
+    except Exception as e:
+        logger.warning("Trending cache read failed for %s: %s", key, e)
+        return None
+
+
+async def _cache_set(key: str, value) -> None:
+    """Write a cached value with TTL - failures are logged, never raised"""
+    try:
+        await get_redis_client().setex(key, TRENDING_CACHE_TTL, value)
+    except Exception as e:
+        logger.warning("Trending cache write failed for %s: %s", key, e)
+
+
+# Fields DishRecommendation is built from - skip steps and other large/unused fields
+TRENDING_PROJECTION = {
+    "name": 1, "description": 1, "image_url": 1, "category": 1, "cuisine_type": 1,
+    "difficulty": 1, "cooking_time": 1, "average_rating": 1, "like_count": 1,
+    "cook_count": 1, "view_count": 1, "ingredients": 1, "created_at": 1,
+}
+
+
+async def ensure_recommendation_indexes():
+    """
+    Create the index backing /trending
+    Equality on is_active, then the exact sort keys - the feed is an index scan with no
+    in-memory SORT, and min_rating is a range on the average_rating prefix
+    Set SKIP_INDEX_ENSURE=1 where indexes are provisioned by migration
+    """
+    if os.getenv("SKIP_INDEX_ENSURE") == "1":
+        return
+
+    try:
+        await dishes_collection.create_index(
+            [("is_active", 1), ("average_rating", -1), ("created_at", -1), ("_id", -1)]
+        )
+        logger.info("✅ Recommendation indexes created successfully")
+    except Exception as e:
+        logger.warning("⚠️ Recommendation index creation failed (may already exist): %s", e)
+
+
+def _to_float(value, default=0.0):
+    """Lenient float for legacy docs - numeric strings are parsed, null/junk falls back to default"""
+    if value is None:
+        return default
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if math.isfinite(value) else default
+
+
+def _to_int(value, default=0):
+    """Lenient int for legacy docs - "30" / "30.5" / 30.5 truncate to 30, null/junk falls back to default"""
+    value = _to_float(value, None)
+    return default if value is None else int(value)
 
 
 class DishRecommendation(BaseModel):
@@ -40,7 +117,9 @@ class RecommendationResponse(BaseModel):
     metadata: Optional[dict] = None
 
 
-@router.get("/trending", response_model=RecommendationResponse)
+# Returns a prebuilt orjson Response, so response_model/response_class would never apply -
+# the schema is only documented for OpenAPI
+@router.get("/trending", responses={200: {"model": RecommendationResponse}})
 async def get_trending_dishes(
     days: int = Query(7, ge=1, le=30, description="Window for trending (unused)"),
     limit: int = Query(6, ge=1, le=100, description="Number of items per page (default 6)"),
@@ -53,13 +132,19 @@ async def get_trending_dishes(
     This endpoint is intentionally minimal — no personalized logic.
     """
     try:
+        # ✅ Cache hit: serve the stored JSON as-is (no DB, no re-serialization)
+        cache_key = f"trending:{min_rating}:{offset}:{limit}"
+        cached = await _cache_get(cache_key)
+        if cached:
+            return Response(content=cached, media_type="application/json")
+
         match_query = {"is_active": True}
         if min_rating and min_rating > 0:
             match_query["average_rating"] = {"$gte": min_rating}
 
         cursor = (
             db.dishes
-            .find(match_query)
+            .find(match_query, TRENDING_PROJECTION)
             .sort([
                 ("average_rating", -1),
                 ("created_at", -1),
@@ -69,46 +154,60 @@ async def get_trending_dishes(
             .limit(limit)
         )
 
-        paginated = await cursor.to_list(length=limit)
-        total_available = await db.dishes.count_documents(match_query)
+        # ✅ Total is shared by every page of the same filter - cached under its own key
+        total_key = f"trending:total:{min_rating}"
+        cached_total = await _cache_get(total_key)
+        if cached_total is not None:
+            paginated = await cursor.to_list(length=limit)
+            total_available = int(cached_total)
+        else:
+            # Page and total are independent queries - run them concurrently
+            paginated, total_available = await asyncio.gather(
+                cursor.to_list(length=limit),
+                db.dishes.count_documents(match_query),
+            )
+            await _cache_set(total_key, total_available)
 
+        # ✅ Plain dicts in DishRecommendation's shape, encoded once with orjson -
+        # no per-item model construction and no response_model re-validation pass,
+        # so numeric fields are coerced here with _to_int/_to_float (legacy docs may hold null or numeric strings)
         recommendations = []
         for dish in paginated:
-            rating = round(dish.get("average_rating", 0) or 0, 2)
-            recommendations.append(
-                DishRecommendation(
-                    dish_id=str(dish.get("_id")),
-                    name=dish.get("name", ""),
-                    description=dish.get("description", ""),
-                    image_url=dish.get("image_url", ""),
-                    category=dish.get("category", ""),
-                    cuisine_type=dish.get("cuisine_type", ""),
-                    difficulty=dish.get("difficulty", ""),
-                    cooking_time=dish.get("cooking_time", 0),
-                    average_rating=rating,
-                    like_count=dish.get("like_count", 0),
-                    cook_count=dish.get("cook_count", 0),
-                    view_count=dish.get("view_count", 0),
-                    score=round(rating / 5.0, 3) if rating > 0 else 0,
-                    reason=(f"⭐ {rating:.1f} sao" if rating > 0 else "🆕 Món mới"),
-                    similarity_reason=None,
-                    ingredients=dish.get("ingredients", []),  # ✅ Include ingredients
-                )
-            )
+            rating = round(_to_float(dish.get("average_rating")), 2)
+            recommendations.append({
+                "dish_id": str(dish.get("_id")),
+                "name": dish.get("name", ""),
+                "description": dish.get("description", ""),
+                "image_url": dish.get("image_url", ""),
+                "category": dish.get("category", ""),
+                "cuisine_type": dish.get("cuisine_type", ""),
+                "difficulty": dish.get("difficulty", ""),
+                "cooking_time": _to_int(dish.get("cooking_time"), None),  # Optional in DishRecommendation
+                "average_rating": rating,
+                "like_count": _to_int(dish.get("like_count")),
+                "cook_count": _to_int(dish.get("cook_count")),
+                "view_count": _to_int(dish.get("view_count")),
+                "score": round(rating / 5.0, 3) if rating > 0 else 0.0,
+                "reason": (f"⭐ {rating:.1f} sao" if rating > 0 else "🆕 Món mới"),
+                "similarity_reason": None,
+                "ingredients": dish.get("ingredients", []),  # ✅ Include ingredients
+            })
 
-        return RecommendationResponse(
-            recommendations=recommendations,
-            total=total_available,
-            algorithm="feed_by_rating_and_recency",
-            generated_at=datetime.utcnow(),
-            metadata={
+        body = orjson.dumps({
+            "recommendations": recommendations,
+            "total": total_available,
+            "algorithm": "feed_by_rating_and_recency",
+            "generated_at": datetime.utcnow(),
+            "metadata": {
                 "offset": offset,
                 "limit": limit,
                 "total_available": total_available,
                 "returned": len(recommendations),
                 "has_more": (offset + len(recommendations)) < total_available,
             },
-        )
+        })
+        await _cache_set(cache_key, body)
+        return Response(content=body, media_type="application/json")
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching dishes: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error fetching dishes: {str(e)}")
@@ -4,7 +4,7 @@ All handlers moved to utils.user_handlers for better organization
 """
 from pydantic import BaseModel
 from typing import Literal, Optional, List, Dict, Any
-from fastapi import APIRouter, Depends, Body, HTTPException
+from fastapi import APIRouter, Depends, Body, HTTPException, Header, Response
 from models.user_model import UserOut
 from database.mongo import user_activity_collection as user_activity_col
 from core.auth.dependencies import get_current_user
@@ -110,8 +110,17 @@ async def get_user(user_id: str):
     return await get_user_handler(user_id)
 
 @router.get("/me/favorites")
-async def get_my_favorites(decoded=Depends(get_current_user)):
-    return await get_my_favorites_handler(decoded)
+async def get_my_favorites(
+    response: Response,
+    decoded=Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None),
+):
+    etag, dishes = await get_my_favorites_handler(decoded, if_none_match)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=0, must-revalidate"}
+    if dishes is None:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return dishes
 
 @router.get("/me/is-admin")
 async def check_is_admin(decoded=Depends(get_current_user)):
@@ -0,0 +1,40 @@
+"""
+Script to initialise dishes.favorite_count from users.favorite_dishes
+The favorite toggle keeps the counter up to date from then on
+Run: python scripts/backfill_dish_favorite_counts.py
+"""
+
+import asyncio
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from database.mongo import users_collection, dishes_collection
+
+
+async def backfill_dish_favorite_counts():
+    """Count favorites per dish server-side and write every counter in one bulk_write"""
+    counts = await users_collection.aggregate([
+        {"$unwind": "$favorite_dishes"},
+        {"$group": {"_id": {"$toString": "$favorite_dishes"}, "count": {"$sum": 1}}},
+    ]).to_list(length=None)
+
+    # Dishes nobody favorites get an explicit 0
+    await dishes_collection.update_many({}, {"$set": {"favorite_count": 0}})
+
+    ops = [
+        UpdateOne({"_id": ObjectId(c["_id"])}, {"$set": {"favorite_count": c["count"]}})
+        for c in counts
+        if ObjectId.is_valid(c["_id"])
+    ]
+    if ops:
+        await dishes_collection.bulk_write(ops, ordered=False)
+    print(f"✅ Backfilled favorite_count for {len(ops)} favorited dish(es)")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_dish_favorite_counts())
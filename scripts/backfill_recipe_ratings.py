@@ -0,0 +1,55 @@
+"""
+Script to compute average_rating at rest for recipes that predate the rating pipeline
+List endpoints read the stored average directly, so every recipe must carry one
+Run: python scripts/backfill_recipe_ratings.py
+"""
+
+import asyncio
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.mongo import recipe_collection
+
+# Same rule as rate_recipe_handler: user_ratings wins, legacy ratings array otherwise
+_VALUES = {
+    "$cond": {
+        "if": {"$gt": [{"$size": {"$objectToArray": {"$ifNull": ["$user_ratings", {}]}}}, 0]},
+        "then": {"$map": {"input": {"$objectToArray": "$user_ratings"}, "as": "r", "in": "$$r.v"}},
+        "else": {"$ifNull": ["$ratings", []]},
+    }
+}
+
+BACKFILL_PIPELINE = [
+    {
+        "$set": {
+            "average_rating": {
+                "$let": {
+                    "vars": {"values": _VALUES},
+                    "in": {
+                        "$cond": {
+                            "if": {"$gt": [{"$size": "$$values"}, 0]},
+                            "then": {"$round": [{"$avg": "$$values"}, 2]},
+                            "else": 0.0,
+                        }
+                    },
+                }
+            }
+        }
+    }
+]
+
+
+async def backfill_recipe_ratings():
+    """Set average_rating on every recipe that is missing it"""
+    result = await recipe_collection.update_many(
+        {"average_rating": {"$exists": False}},
+        BACKFILL_PIPELINE,
+    )
+    print(f"✅ Backfilled average_rating on {result.modified_count} recipe(s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_recipe_ratings())
@@ -2,6 +2,7 @@
 Script to mark a user as admin in the database.
 Usage:
   python create_admin.py --email admin@example.com
+  python create_admin.py --email a@example.com b@example.com   # several in one run
 
 This sets the `role` field to 'admin' on the users collection.
 It uses MONGODB_URI and DATABASE_NAME environment variables from .env
@@ -17,7 +18,7 @@ MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DATABASE_NAME", "cook_app")
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--email", required=True, help="Email of user to promote to admin")
+parser.add_argument("--email", required=True, nargs="+", help="Email(s) of user(s) to promote to admin")
 args = parser.parse_args()
 
 if not MONGODB_URI:
@@ -28,10 +29,15 @@ client = MongoClient(MONGODB_URI)
 db = client[DB_NAME]
 users = db["users"]
 
-res = users.update_one({"email": args.email}, {"$set": {"role": "admin"}})
-if res.matched_count:
-    print(f"User {args.email} updated to role=admin")
-else:
-    print(f"No user found with email {args.email}")
+# One connection, one update for every email
+emails = list(dict.fromkeys(args.email))
+res = users.update_many({"email": {"$in": emails}}, {"$set": {"role": "admin"}})
+print(f"{res.matched_count} user(s) updated to role=admin")
+
+if res.matched_count < len(emails):
+    found = set(users.distinct("email", {"email": {"$in": emails}}))
+    for email in emails:
+        if email not in found:
+            print(f"No user found with email {email}")
 
 client.close()
\ No newline at end of file
@@ -15,6 +15,8 @@ from firebase_admin.exceptions import FirebaseError
 from dotenv import load_dotenv
 import os
 import sys
+import atexit
+import time
 from datetime import datetime
 from typing import Optional
 
@@ -22,24 +24,56 @@ load_dotenv()
 
 # ==================== LOGGING ====================
 
-def log_audit(message: str, level: str = "INFO"):
-    """Log to audit trail with timestamp"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] [{level}] {message}"
-    print(log_entry)
-    
-    # Append to audit log file
+# Flush WARNING/ERROR lines as soon as they are written (set to "false" to buffer everything)
+AUDIT_IMMEDIATE_FLUSH = os.getenv("AUDIT_IMMEDIATE_FLUSH", "true").lower() == "true"
+
+# Audit lines collected during the run - written with a single write() call by _flush_audit
+_pending: list[str] = []
+
+
+def _flush_audit():
+    """Append every pending audit line to the log file in one write - runs at exit (incl. sys.exit)"""
+    if not _pending:
+        return
     try:
         log_dir = os.path.join(os.path.dirname(__file__), "logs")
         os.makedirs(log_dir, exist_ok=True)
         
         log_file = os.path.join(log_dir, "admin_claims_audit.log")
         with open(log_file, "a", encoding="utf-8") as f:
-            f.write(log_entry + "\n")
+            f.write("".join(_pending))
+        _pending.clear()
     except Exception as e:
         print(f"⚠️  Failed to write audit log: {e}")
 
 
+atexit.register(_flush_audit)
+
+# (epoch second, formatted timestamp) - lines logged within the same second reuse the string,
+# so queuing a line on _pending costs no strftime call
+_ts_cache = (0, "")
+
+
+def log_audit(message: str, level: str = "INFO"):
+    """
+    Log to audit trail with timestamp
+    Printed immediately; the file line is queued on _pending and written by _flush_audit
+    (at exit, or right away for WARNING/ERROR when AUDIT_IMMEDIATE_FLUSH is on)
+    """
+    global _ts_cache
+    sec = int(time.time())
+    if sec != _ts_cache[0]:
+        _ts_cache = (sec, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec)))
+    timestamp = _ts_cache[1]
+    log_entry = f"[{timestamp}] [{level}] {message}"
+    print(log_entry)
+    
+    # Queue for the audit log file - written once at exit
+    _pending.append(log_entry + "\n")
+    if AUDIT_IMMEDIATE_FLUSH and level in ("WARNING", "ERROR"):
+        _flush_audit()
+
+
 # ==================== HELPER FUNCTIONS ====================
 
 def get_user_by_uid(uid: str) -> Optional[auth.UserRecord]:
@@ -115,6 +149,7 @@ Examples:
   python set_firebase_admin_claim.py --uid abc123xyz --admin true
   python set_firebase_admin_claim.py --email admin@example.com --admin true
   python set_firebase_admin_claim.py --uid abc123xyz --admin false --skip-confirm
+  python set_firebase_admin_claim.py --email admin@example.com --admin true --verify
         """
     )
     
@@ -138,6 +173,13 @@ Examples:
         help="Skip confirmation prompt (use with caution!)"
     )
     
+    # Re-read the user after writing (extra Auth API call)
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Re-fetch the user after the update to confirm the claim"
+    )
+    
     args = parser.parse_args()
     
     # ==================== INITIALIZE FIREBASE ====================
@@ -206,33 +248,34 @@ Examples:
         existing_claims = user.custom_claims or {}
         new_claims = {**existing_claims, "admin": is_admin}
         
+        # set_custom_user_claims raises on failure - returning means the claims were written
         auth.set_custom_user_claims(user.uid, new_claims)
         
-        # Verify the change
-        updated_user = auth.get_user(user.uid)
-        actual_admin = updated_user.custom_claims.get("admin", False)
+        # Optional read-back (--verify)
+        if args.verify:
+            updated_user = auth.get_user(user.uid)
+            actual_admin = (updated_user.custom_claims or {}).get("admin", False)
+            if actual_admin != is_admin:
+                print(f"\n⚠️  Warning: Claim was set but verification failed.")
+                print(f"Expected admin={is_admin}, got admin={actual_admin}")
+                log_audit(
+                    f"Claim verification mismatch - User: {user.uid}, "
+                    f"Expected: {is_admin}, Got: {actual_admin}",
+                    "WARNING"
+                )
+                return
         
-        if actual_admin == is_admin:
-            print(f"\n✅ SUCCESS! Admin claim set to {is_admin}")
-            print(f"User: {user.email or user.uid}")
-            print(f"New claims: {updated_user.custom_claims}")
-            
-            log_audit(
-                f"Admin claim successfully set - User: {user.email or user.uid}, "
-                f"UID: {user.uid}, Admin: {is_admin}",
-                "SUCCESS"
-            )
-            
-            print("\n💡 Note: User must sign out and sign in again for changes to take effect.")
-            
-        else:
-            print(f"\n⚠️  Warning: Claim was set but verification failed.")
-            print(f"Expected admin={is_admin}, got admin={actual_admin}")
-            log_audit(
-                f"Claim verification mismatch - User: {user.uid}, "
-                f"Expected: {is_admin}, Got: {actual_admin}",
-                "WARNING"
-            )
+        print(f"\n✅ SUCCESS! Admin claim set to {is_admin}")
+        print(f"User: {user.email or user.uid}")
+        print(f"New claims: {new_claims}")
+        
+        log_audit(
+            f"Admin claim successfully set - User: {user.email or user.uid}, "
+            f"UID: {user.uid}, Admin: {is_admin}",
+            "SUCCESS"
+        )
+        
+        print("\n💡 Note: User must sign out and sign in again for changes to take effect.")
             
     except auth.UserNotFoundError:
         print(f"\n❌ Error: User no longer exists: {user.uid}")
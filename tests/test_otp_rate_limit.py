@@ -0,0 +1,43 @@
+"""
+Token-bucket rate limit against a real redis-py Script (fakeredis + Lua)
+Run: python -m pytest tests/test_otp_rate_limit.py
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("fastapi")
+pytest.importorskip("lupa")  # fakeredis needs lupa to run EVAL/EVALSHA
+fakeredis = pytest.importorskip("fakeredis")
+
+from routes import otp_route
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(otp_route, "get_redis_client", lambda: client)
+    monkeypatch.setattr(otp_route, "_bucket_script", None)
+    return client
+
+
+def test_check_rate_limit_runs_script_and_takes_a_token(redis):
+    allowed = asyncio.run(otp_route.check_rate_limit("a@example.com", "send_otp"))
+    assert allowed is True
+    tokens = asyncio.run(redis.hget("rl:send_otp:a@example.com", "tokens"))
+    assert float(tokens) == otp_route.RATE_LIMIT_CAPACITY - 1
+
+
+def test_check_rate_limit_denies_after_capacity(redis):
+    async def run():
+        return [
+            await otp_route.check_rate_limit("b@example.com", "resend_otp")
+            for _ in range(otp_route.RATE_LIMIT_CAPACITY + 1)
+        ]
+
+    results = asyncio.run(run())
+    assert results == [True] * otp_route.RATE_LIMIT_CAPACITY + [False]
@@ -2,49 +2,76 @@
 Recipe Route Handlers - Extracted from routes/recipe_route.py
 All recipe-related route handlers consolidated here
 """
+import asyncio
 import logging
+import os
 from fastapi import HTTPException
-from models.recipe_model import RecipeIn, RecipeOut
+from models.recipe_model import RecipeIn, RecipeOut, RecipeListItemOut
 from database.mongo import recipe_collection, users_collection
 from core.auth.dependencies import extract_user_email
 from bson import ObjectId
-from typing import List
+from pymongo import UpdateOne
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# email -> True; only hits are cached so a newly registered user is never stuck on 404
+# (there is no user-delete path, so a stale hit can only outlive its user by the 60s TTL)
+_user_exists_cache = TTLCache(ttl=60, maxsize=10_000)
+
+# recipe_id -> RecipeOut for public detail GETs; dropped when the recipe is rated or its dish deleted
+_recipe_detail_cache = TTLCache(ttl=30, maxsize=10_000)
+
+
+def invalidate_recipe_detail(recipe_id: str) -> None:
+    """
+    Drop a cached recipe detail - also called from the dish delete paths, which delete the linked recipe
+    """
+    _recipe_detail_cache.pop(recipe_id)
+
+# Upper bound on recipes rated in one bulk request
+MAX_BULK_RATINGS = 100
+
 
 # ==================== INDEX MANAGEMENT ====================
 
+# Set after the first successful run - later calls in this process are no-ops
+_indexes_ready = False
+
+
 async def ensure_recipe_indexes():
     """
     Create necessary indexes for recipes collection
+    Set SKIP_INDEX_ENSURE=1 where indexes are provisioned by migration
     """
-    try:
-        # Index for finding recipes by creator
-        await recipe_collection.create_index("created_by")
-        
-        # Index for finding recipes by dish
-        await recipe_collection.create_index("dish_id")
-        
-        # Index for sorting by rating
-        await recipe_collection.create_index("average_rating")
-        
-        # Compound index for efficient queries
-        await recipe_collection.create_index([
-            ("created_by", 1),
-            ("created_at", -1)
-        ])
-        
-        # Text index for search functionality
-        await recipe_collection.create_index([
-            ("name", "text"),
-            ("description", "text"),
-            ("instructions", "text")
-        ])
-        
+    global _indexes_ready
+    if _indexes_ready or os.getenv("SKIP_INDEX_ENSURE") == "1":
+        return
+
+    # Independent create_index calls - fan out so first run costs one round-trip, not five
+    index_specs = [
+        "created_by",                                   # finding recipes by creator
+        "dish_id",                                      # finding recipes by dish
+        "average_rating",                               # sorting by rating
+        [("created_by", 1), ("created_at", -1)],        # compound index for efficient queries
+        [("name", "text"), ("description", "text"), ("instructions", "text")],  # search
+    ]
+    results = await asyncio.gather(
+        *(recipe_collection.create_index(spec) for spec in index_specs),
+        return_exceptions=True
+    )
+
+    failed = False
+    for spec, result in zip(index_specs, results):
+        if isinstance(result, Exception):
+            failed = True
+            logger.warning("⚠️ Recipe index %s creation failed (may already exist): %s", spec, result)
+
+    if not failed:
+        _indexes_ready = True
         logger.info("✅ Recipe indexes created successfully")
-    except Exception as e:
-        logger.warning(f"⚠️ Recipe index creation failed (may already exist): {e}")
 
 
 # ==================== HELPER FUNCTIONS ====================
@@ -77,31 +104,103 @@ def validate_rating(rating: int) -> int:
 def extract_ratings_from_recipe(recipe: dict) -> List[int]:
     """
     Extract ratings from recipe, ensuring all ratings are 1-5 stars
+    Invalid values are skipped inline (no exception per bad rating)
+    """
+    user_ratings = recipe.get("user_ratings")
+    # New format: user_ratings = {"email": rating}; old format: ratings = [1, 2, 3, 4, 5]
+    values = user_ratings.values() if user_ratings else recipe.get("ratings", [])
+    return [r for r in values if type(r) is int and 1 <= r <= 5]
+
+
+def _recipe_to_out(recipe: dict, ratings: Optional[List[int]] = None) -> RecipeOut:
+    """
+    Build RecipeOut from a stored recipe document
+    Uses model_construct - the data comes from our own collection, so validation is skipped
+    """
+    return RecipeOut.model_construct(
+        id=str(recipe["_id"]),
+        name=recipe["name"],
+        description=recipe.get("description", ""),
+        ingredients=recipe["ingredients"],
+        difficulty=recipe.get("difficulty", "medium"),
+        image_url=recipe.get("image_url"),
+        instructions=recipe["instructions"],
+        dish_id=recipe["dish_id"],
+        created_by=recipe["created_by"],
+        ratings=ratings if ratings is not None else [],
+        average_rating=recipe.get("average_rating", 0.0),
+    )
+
+
+def _recipe_to_list_item(recipe: dict) -> RecipeListItemOut:
     """
-    user_ratings = recipe.get("user_ratings", {})
-    if user_ratings:
-        # New format: user_ratings = {"email": rating}
-        ratings = []
-        for email, rating in user_ratings.items():
-            try:
-                validated_rating = validate_rating(rating)
-                ratings.append(validated_rating)
-            except HTTPException:
-                # Skip invalid ratings but don't crash
-                continue
-        return ratings
-    else:
-        # Old format: ratings = [1, 2, 3, 4, 5]
-        ratings = recipe.get("ratings", [])
-        validated_ratings = []
-        for rating in ratings:
-            try:
-                validated_rating = validate_rating(rating)
-                validated_ratings.append(validated_rating)
-            except HTTPException:
-                # Skip invalid ratings but don't crash
-                continue
-        return validated_ratings
+    Build the lightweight list item from a list-projected recipe document
+    """
+    return RecipeListItemOut.model_construct(
+        id=str(recipe["_id"]),
+        name=recipe["name"],
+        description=recipe.get("description", ""),
+        difficulty=recipe.get("difficulty", "medium"),
+        image_url=recipe.get("image_url"),
+        dish_id=recipe["dish_id"],
+        created_by=recipe["created_by"],
+        average_rating=recipe.get("average_rating", 0.0),
+    )
+
+
+def _rating_update_pipeline(user_email: str, rating: int) -> list:
+    """
+    Aggregation-pipeline update: set the user's rating, rebuild ratings, recalculate average
+    """
+    return [
+        {
+            "$set": {
+                f"user_ratings.{user_email}": rating,
+                "updated_at": "$$NOW"
+            }
+        },
+        {
+            "$set": {
+                # Recalculate ratings array from user_ratings
+                "ratings": {
+                    "$map": {
+                        "input": {"$objectToArray": "$user_ratings"},
+                        "as": "rating",
+                        "in": "$$rating.v"
+                    }
+                }
+            }
+        },
+        {
+            "$set": {
+                # Recalculate average from new ratings array
+                "average_rating": {
+                    "$cond": {
+                        "if": {"$gt": [{"$size": "$ratings"}, 0]},
+                        "then": {
+                            "$round": [
+                                {"$avg": "$ratings"},
+                                2
+                            ]
+                        },
+                        "else": 0.0
+                    }
+                }
+            }
+        }
+    ]
+
+
+async def _user_exists(email: str) -> bool:
+    """
+    Check user existence with an _id-only lookup, cached per worker for 60s
+    """
+    if _user_exists_cache.get(email):
+        return True
+    user = await users_collection.find_one({"email": email}, {"_id": 1})
+    if user:
+        _user_exists_cache.set(email, True)
+    return user is not None
 
 
 # ==================== RECIPE HANDLERS ====================
@@ -110,14 +209,11 @@ async def create_recipe_handler(recipe: RecipeIn, decoded):
     """
     Tạo công thức mới với validation và error handling
     """
-    from datetime import datetime, timezone
-    
     user_email = extract_user_email(decoded)
     
     try:
         # Validate user exists
-        user = await users_collection.find_one({"email": user_email})
-        if not user:
+        if not await _user_exists(user_email):
             raise HTTPException(status_code=404, detail="User not found")
         
         # Validate dish_id if provided
@@ -136,8 +232,9 @@ async def create_recipe_handler(recipe: RecipeIn, decoded):
         recipe_dict["average_rating"] = 0.0
         recipe_dict["user_ratings"] = {}  # For new rating system
         recipe_dict["created_by"] = user_email  # Ensure consistency
-        recipe_dict["created_at"] = datetime.now(timezone.utc)  # Add timestamp
-        recipe_dict["updated_at"] = datetime.now(timezone.utc)
+        now = datetime.now(timezone.utc)
+        recipe_dict["created_at"] = now  # Add timestamp
+        recipe_dict["updated_at"] = now
 
         result = await recipe_collection.insert_one(recipe_dict)
         if not result.inserted_id:
@@ -145,22 +242,8 @@ async def create_recipe_handler(recipe: RecipeIn, decoded):
         
         logger.info(f"Recipe created by {user_email}: {result.inserted_id}")
         
-        # ✅ Return data based on actual inserted document
-        created_recipe = await recipe_collection.find_one({"_id": result.inserted_id})
-        
-        return RecipeOut(
-            id=str(created_recipe["_id"]),
-            name=created_recipe["name"],
-            description=created_recipe.get("description", ""),
-            ingredients=created_recipe["ingredients"],
-            difficulty=created_recipe.get("difficulty", "medium"),
-            image_url=created_recipe.get("image_url"),
-            instructions=created_recipe["instructions"],
-            dish_id=created_recipe["dish_id"],
-            created_by=created_recipe["created_by"],
-            ratings=[],
-            average_rating=0.0
-        )
+        # ✅ Build the response from the document we just inserted (insert_one set its _id) - no read-back round-trip
+        return _recipe_to_out(recipe_dict)
     except HTTPException:
         raise
     except Exception as e:
@@ -168,9 +251,10 @@ async def create_recipe_handler(recipe: RecipeIn, decoded):
         raise HTTPException(status_code=500, detail="Failed to create recipe")
 
 
-async def get_all_recipes_handler(skip: int = 0, limit: int = 20):
+async def get_all_recipes_handler(skip: int = 0, limit: int = 20, after_id: Optional[str] = None):
     """
     Lấy tất cả công thức (public) với pagination
+    Pass after_id (the last id of the previous page) for keyset pagination - skip is ignored then
     """
     # Validate pagination parameters
     if skip < 0:
@@ -183,38 +267,28 @@ async def get_all_recipes_handler(skip: int = 0, limit: int = 20):
         projection = {
             "name": 1,
             "description": 1,
-            "ingredients": 1,
             "difficulty": 1,
             "image_url": 1,
-            "instructions": 1,
             "dish_id": 1,
             "created_by": 1,
-            "ratings": 1,
-            "user_ratings": 1,
+            # ✅ Stored average only - user_ratings/ratings never leave MongoDB on list pages
             "average_rating": 1
         }
-        recipes = await recipe_collection.find({}, projection).sort("_id", -1).skip(skip).limit(limit).to_list(length=limit)
+        if after_id:
+            # ✅ Keyset: walk the _id index from the cursor instead of scanning past skip docs
+            query = {"_id": {"$lt": _validate_object_id(after_id, "cursor")}}
+            cursor = recipe_collection.find(query, projection).sort("_id", -1)
+        else:
+            cursor = recipe_collection.find({}, projection).sort("_id", -1).skip(skip)
+        recipes = await cursor.limit(limit).to_list(length=limit)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to fetch recipes: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch recipes")
     
-    return [
-        RecipeOut(
-            id=str(recipe["_id"]),
-            name=recipe["name"],
-            description=recipe.get("description", ""),
-            ingredients=recipe["ingredients"],
-            difficulty=recipe.get("difficulty", "medium"),
-            image_url=recipe.get("image_url"),
-            instructions=recipe["instructions"],
-            dish_id=recipe["dish_id"],
-            created_by=recipe["created_by"],
-            # ✅ FIXED: Use validated ratings extraction
-            ratings=extract_ratings_from_recipe(recipe),
-            average_rating=recipe.get("average_rating", 0.0),
-        )
-        for recipe in recipes
-    ]
+    # List shape: ingredients/instructions/ratings are only returned by get_recipe_handler
+    return [_recipe_to_list_item(recipe) for recipe in recipes]
 
 
 async def get_recipe_handler(recipe_id: str):
@@ -223,6 +297,10 @@ async def get_recipe_handler(recipe_id: str):
     """
     recipe_oid = _validate_object_id(recipe_id, "recipe ID")
 
+    cached = _recipe_detail_cache.get(recipe_id)
+    if cached is not None:
+        return cached
+
     try:
         recipe = await recipe_collection.find_one({"_id": recipe_oid})
         if not recipe:
@@ -234,21 +312,9 @@ async def get_recipe_handler(recipe_id: str):
         raise HTTPException(status_code=500, detail="Failed to fetch recipe")
 
     # ✅ FIXED: Handle both old and new rating format with validation
-    ratings = extract_ratings_from_recipe(recipe)
-
-    return RecipeOut(
-        id=str(recipe["_id"]),
-        name=recipe["name"],
-        description=recipe.get("description", ""),
-        ingredients=recipe["ingredients"],
-        difficulty=recipe.get("difficulty", "medium"),
-        image_url=recipe.get("image_url"),
-        instructions=recipe["instructions"],
-        dish_id=recipe["dish_id"],
-        created_by=recipe["created_by"],
-        ratings=ratings,
-        average_rating=recipe.get("average_rating", 0.0),
-    )
+    recipe_out = _recipe_to_out(recipe, extract_ratings_from_recipe(recipe))
+    _recipe_detail_cache.set(recipe_id, recipe_out)
+    return recipe_out
 
 
 async def get_recipes_by_user_handler(decoded):
@@ -258,22 +324,18 @@ async def get_recipes_by_user_handler(decoded):
     user_email = extract_user_email(decoded)
     
     try:
-        user = await users_collection.find_one({"email": user_email})
-        if not user:
+        if not await _user_exists(user_email):
             raise HTTPException(status_code=404, detail="User not found")
         
         # Use projection for better performance
         projection = {
             "name": 1,
             "description": 1,
-            "ingredients": 1,
             "difficulty": 1,
             "image_url": 1,
-            "instructions": 1,
             "dish_id": 1,
             "created_by": 1,
-            "ratings": 1,
-            "user_ratings": 1,
+            # ✅ Stored average only - user_ratings/ratings never leave MongoDB on list pages
             "average_rating": 1
         }
         recipes = await recipe_collection.find({"created_by": user_email}, projection).to_list(length=100)
@@ -283,23 +345,8 @@ async def get_recipes_by_user_handler(decoded):
         logger.error(f"Failed to fetch user recipes for {user_email}: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch user recipes")
     
-    return [
-        RecipeOut(
-            id=str(recipe["_id"]),
-            name=recipe["name"],
-            description=recipe.get("description", ""),
-            ingredients=recipe["ingredients"],
-            difficulty=recipe.get("difficulty", "medium"),
-            image_url=recipe.get("image_url"),
-            instructions=recipe["instructions"],
-            dish_id=recipe["dish_id"],
-            created_by=recipe["created_by"],
-            # ✅ FIXED: Handle both rating formats with validation
-            ratings=extract_ratings_from_recipe(recipe),
-            average_rating=recipe.get("average_rating", 0.0),
-        )
-        for recipe in recipes
-    ]
+    # List shape: ingredients/instructions/ratings are only returned by get_recipe_handler
+    return [_recipe_to_list_item(recipe) for recipe in recipes]
 
 
 async def rate_recipe_handler(recipe_id: str, rating: int, decoded):
@@ -319,43 +366,9 @@ async def rate_recipe_handler(recipe_id: str, rating: int, decoded):
         
         result = await recipe_collection.find_one_and_update(
             {"_id": recipe_oid},
-            [
-                {
-                    "$set": {
-                        f"user_ratings.{user_email}": validated_rating,
-                        "updated_at": "$$NOW"
-                    }
-                },
-                {
-                    "$set": {
-                        # Recalculate ratings array from user_ratings
-                        "ratings": {
-                            "$map": {
-                                "input": {"$objectToArray": "$user_ratings"},
-                                "as": "rating",
-                                "in": "$$rating.v"
-                            }
-                        }
-                    }
-                },
-                {
-                    "$set": {
-                        # Recalculate average from new ratings array
-                        "average_rating": {
-                            "$cond": {
-                                "if": {"$gt": [{"$size": "$ratings"}, 0]},
-                                "then": {
-                                    "$round": [
-                                        {"$avg": "$ratings"},
-                                        2
-                                    ]
-                                },
-                                "else": 0.0
-                            }
-                        }
-                    }
-                }
-            ],
+            _rating_update_pipeline(user_email, validated_rating),
+            # ✅ Only the new average comes back - not ingredients/instructions/user_ratings
+            projection={"average_rating": 1},
             return_document=True
         )
         
@@ -364,6 +377,7 @@ async def rate_recipe_handler(recipe_id: str, rating: int, decoded):
         
         # Extract final average for response
         final_avg = result.get("average_rating", 0.0)
+        invalidate_recipe_detail(recipe_id)
         
         logger.info(f"Recipe {recipe_id} rated by {user_email}: {validated_rating} (avg: {final_avg})")
         return {
@@ -377,3 +391,48 @@ async def rate_recipe_handler(recipe_id: str, rating: int, decoded):
     except Exception as e:
         logger.error(f"Failed to rate recipe {recipe_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to rate recipe")
+
+
+async def rate_recipes_bulk_handler(ratings: Dict[str, int], decoded):
+    """
+    Rate many recipes in one request - one bulk_write of the same atomic pipeline update
+    """
+    user_email = extract_user_email(decoded)
+    if not ratings:
+        raise HTTPException(status_code=400, detail="No ratings provided")
+    if len(ratings) > MAX_BULK_RATINGS:
+        raise HTTPException(status_code=400, detail=f"Too many ratings (max {MAX_BULK_RATINGS})")
+
+    validated = {
+        _validate_object_id(recipe_id, "recipe ID"): validate_rating(rating)
+        for recipe_id, rating in ratings.items()
+    }
+
+    try:
+        ops = [
+            UpdateOne({"_id": recipe_oid}, _rating_update_pipeline(user_email, rating))
+            for recipe_oid, rating in validated.items()
+        ]
+        await recipe_collection.bulk_write(ops, ordered=False)
+        for recipe_oid in validated:
+            invalidate_recipe_detail(str(recipe_oid))
+
+        # One read for every resulting average
+        docs = await recipe_collection.find(
+            {"_id": {"$in": list(validated)}}, {"average_rating": 1}
+        ).to_list(length=len(validated))
+    except Exception as e:
+        logger.error(f"Failed to bulk rate recipes for {user_email}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to rate recipes")
+
+    averages = {str(doc["_id"]): doc.get("average_rating", 0.0) for doc in docs}
+    logger.info(f"{len(averages)} recipe(s) bulk rated by {user_email}")
+    return {
+        "msg": "Recipes rated successfully",
+        "results": {
+            str(recipe_oid): {"average_rating": averages[str(recipe_oid)], "user_rating": rating}
+            for recipe_oid, rating in validated.items()
+            if str(recipe_oid) in averages
+        },
+        "not_found": [str(recipe_oid) for recipe_oid in validated if str(recipe_oid) not in averages]
+    }
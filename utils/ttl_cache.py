@@ -0,0 +1,39 @@
+"""
+In-process TTL cache for hot read paths
+Per-worker only - use for data where a short staleness window is acceptable
+"""
+import time
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """
+    Dict-backed cache with per-entry expiry and a size cap
+    When full, the oldest inserted entry is evicted first
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if key not in self._data and len(self._data) >= self.maxsize:
+            self._data.pop(next(iter(self._data)), None)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
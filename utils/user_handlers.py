@@ -2,13 +2,22 @@
 User Route Handlers - Extracted from routes/user/
 All user-related route handlers consolidated here
 """
+import asyncio
+import logging
+import os
+import re
+from functools import lru_cache
 from fastapi import HTTPException, Body
 from core.user_management.service import UserDataService, user_helper
 from core.auth.dependencies import extract_user_email, get_user_by_email
 from models.user_model import UserOut
 from bson import ObjectId
-from typing import Dict, Any, List
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone, timedelta
+from utils.ttl_cache import TTLCache
 
 from database.mongo import (
     users_collection,
@@ -19,6 +28,18 @@ from database.mongo import (
     dishes_collection
 )
 
+logger = logging.getLogger(__name__)
+
+
+# email -> bool from the DB role check (per worker, 60s)
+_admin_role_cache = TTLCache(ttl=60, maxsize=1024)
+
+
+@lru_cache(maxsize=1)
+def _admin_email_set() -> frozenset:
+    """ADMIN_EMAILS parsed once per process"""
+    return frozenset(e.strip() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip())
+
 
 async def is_admin(decoded) -> bool:
     """
@@ -32,8 +53,6 @@ async def is_admin(decoded) -> bool:
     
     ⚠️ SECURITY: DEBUG mode does NOT grant admin access!
     """
-    import os, logging
-    
     # ❌ REMOVED: DEBUG mode granting admin to everyone (SECURITY RISK!)
     # if os.getenv("DEBUG", "False").lower() == "true":
     #     return True
@@ -53,59 +72,100 @@ async def is_admin(decoded) -> bool:
         pass
 
     # 2) ADMIN_EMAILS
+    user_email = None
     try:
         user_email = extract_user_email(decoded)
-        admin_emails = os.getenv("ADMIN_EMAILS", "").split(",")
-        admin_emails = [e.strip() for e in admin_emails if e.strip()]
-        if user_email and user_email in admin_emails:
+        if user_email and user_email in _admin_email_set():
             return True
     except Exception:
         pass
 
-    # 3) DB role
+    # 3) DB role (cached briefly - role changes take up to 60s to apply)
     try:
         if user_email:
-            user_doc = await users_collection.find_one({"email": user_email})
-            if user_doc and user_doc.get("role") == "admin":
-                return True
+            cached = _admin_role_cache.get(user_email)
+            if cached is not None:
+                return cached
+            user_doc = await users_collection.find_one({"email": user_email}, {"role": 1})
+            is_db_admin = bool(user_doc and user_doc.get("role") == "admin")
+            _admin_role_cache.set(user_email, is_db_admin)
+            return is_db_admin
     except Exception:
-        logging.exception("Failed to check user role for admin access")
+        logger.exception("Failed to check user role for admin access")
 
     return False
 
 
+# ==================== INDEX MANAGEMENT ====================
+
+async def ensure_user_indexes():
+    """
+    Indexes for the user handlers' hot filters
+    - users.display_id unique: user creation relies on DuplicateKeyError instead of pre-checks
+      (partial on string display_ids so legacy users without one don't collide on null;
+      users.email is made unique by ensure_otp_indexes)
+    - per-user lookups on user_activity / user_social / user_preferences
+    - user_activity dish-id arrays (multikey) for the old-dish purge
+    - dishes by creator_id, and by recipe_id for the difficulty migration
+    Set SKIP_INDEX_ENSURE=1 where indexes are provisioned by migration
+    """
+    if os.getenv("SKIP_INDEX_ENSURE") == "1":
+        return
+    
+    index_specs = [
+        (users_collection, "display_id", {
+            "unique": True,
+            "partialFilterExpression": {"display_id": {"$type": "string"}},
+        }),
+        # user_activity also holds target_id-keyed docs, so user_id is not unique there
+        (user_activity_collection, "user_id", {}),
+        (user_social_collection, "user_id", {}),
+        # Multikey - the old-dish purge's $or filter/$pull only touches docs referencing the ids
+        (user_activity_collection, "favorite_dishes", {}),
+        (user_activity_collection, "cooked_dishes", {}),
+        (user_activity_collection, "viewed_dishes", {}),
+        (user_activity_collection, "created_dishes", {}),
+        (user_preferences_collection, "user_id", {"unique": True}),
+        (dishes_collection, "creator_id", {}),
+        (dishes_collection, "recipe_id", {
+            "partialFilterExpression": {"recipe_id": {"$exists": True}},
+        }),
+    ]
+    results = await asyncio.gather(
+        *(col.create_index(keys, **options) for col, keys, options in index_specs),
+        return_exceptions=True
+    )
+    
+    failed = False
+    for (col, keys, _), result in zip(index_specs, results):
+        if isinstance(result, Exception):
+            failed = True
+            logger.warning("⚠️ User index %s.%s creation failed (duplicates or already exists): %s", col.name, keys, result)
+    if not failed:
+        logger.info("✅ User indexes created successfully")
+
+
 # ==================== PROFILE HANDLERS ====================
 
-async def create_user_handler(decoded):
+async def _get_user_id_by_email(email: str) -> ObjectId:
     """
-    Tạo user mới từ Firebase token (tự động được gọi khi login lần đầu)
-    Hỗ trợ Google OAuth - nhận name và picture từ token
+    Resolve the current user's _id - identity-only lookup, nothing else crosses the wire
     """
-    email = decoded.get("email")
-    uid = decoded.get("uid")
-    
-    # Google OAuth trả về các field này
-    name = decoded.get("name", "")
-    avatar = decoded.get("picture", "")  # URL avatar từ Google
-    
-    if not email:
-        raise HTTPException(status_code=400, detail="Email required from Firebase token")
+    user = await users_collection.find_one({"email": email}, {"_id": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user["_id"]
 
-    # Kiểm tra user đã tồn tại chưa
-    existing_user = await users_collection.find_one({"email": email})
-    if existing_user:
-        print(f"ℹ️  User already exists: {email}")
-        return user_helper(existing_user)
 
-    # Tạo display_id từ email
-    display_id = email.split('@')[0]
-    original_display_id = display_id
-    
+async def _insert_user_with_unique_display_id(email, uid, name, avatar, display_id) -> dict:
+    """
+    Insert a new user, appending a counter to display_id until the unique index accepts it
+    """
     # ✅ Try to create user với display_id, handle DuplicateKeyError nếu conflict
-    from pymongo.errors import DuplicateKeyError
-    
+    original_display_id = display_id
     counter = 1
     max_attempts = 100  # Tránh infinite loop
+    now = datetime.now(timezone.utc)  # One clock read for both timestamps and every retry
     
     while counter <= max_attempts:
         try:
@@ -117,15 +177,13 @@ async def create_user_handler(decoded):
                 "avatar": avatar,
                 "bio": "",
                 "firebase_uid": uid,
-                "createdAt": datetime.now(timezone.utc),
-                "lastLoginAt": datetime.now(timezone.utc),
+                "createdAt": now,
+                "lastLoginAt": now,
             }
 
             result = await users_collection.insert_one(user_data)
-            new_user = await users_collection.find_one({"_id": result.inserted_id})
-            
-            # ✅ Success - break out of loop
-            break
+            # ✅ Build from what we inserted - no read-back round-trip
+            return {**user_data, "_id": result.inserted_id}
             
         except DuplicateKeyError as e:
             # ✅ display_id conflict - try next number
@@ -133,17 +191,43 @@ async def create_user_handler(decoded):
                 display_id = f"{original_display_id}{counter}"
                 counter += 1
                 continue
-            else:
-                # Other duplicate key error (email, etc.)
-                raise e
-    else:
-        # Reached max_attempts
-        raise HTTPException(500, f"Could not generate unique display_id after {max_attempts} attempts")
+            # Other duplicate key error (email, etc.)
+            raise
+    
+    # Reached max_attempts
+    raise HTTPException(500, f"Could not generate unique display_id after {max_attempts} attempts")
+
+
+async def create_user_handler(decoded):
+    """
+    Tạo user mới từ Firebase token (tự động được gọi khi login lần đầu)
+    Hỗ trợ Google OAuth - nhận name và picture từ token
+    """
+    email = decoded.get("email")
+    uid = decoded.get("uid")
+    
+    # Google OAuth trả về các field này
+    name = decoded.get("name", "")
+    avatar = decoded.get("picture", "")  # URL avatar từ Google
+    
+    if not email:
+        raise HTTPException(status_code=400, detail="Email required from Firebase token")
+
+    # Kiểm tra user đã tồn tại chưa
+    existing_user = await users_collection.find_one({"email": email})
+    if existing_user:
+        logger.info("ℹ️  User already exists: %s", email)
+        return user_helper(existing_user)
+
+    # Tạo display_id từ email
+    display_id = email.split('@')[0]
+    
+    new_user = await _insert_user_with_unique_display_id(email, uid, name, avatar, display_id)
     
     # Khởi tạo các collections phụ cho user - ✅ Pass ObjectId
     await UserDataService.init_user_data(new_user["_id"])
 
-    print(f"✅ Created new user: {email} with display_id: {display_id}")
+    logger.info("✅ Created new user: %s with display_id: %s", email, new_user["display_id"])
     return user_helper(new_user)
 
 
@@ -152,10 +236,12 @@ async def get_user_handler(user_id: str):
     Lấy thông tin user theo ID (public)
     """
     try:
-        user = await users_collection.find_one({"_id": ObjectId(user_id)})
-    except:
+        user_oid = ObjectId(user_id)
+    except (InvalidId, TypeError):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
+    user = await users_collection.find_one({"_id": user_oid})
+
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -180,28 +266,8 @@ async def get_me_handler(decoded):
         # Tạo display_id từ email
         display_id = email.split('@')[0] if email else f"user_{uid[:8]}"
         
-        # Kiểm tra display_id trùng - async call
-        counter = 1
-        original_display_id = display_id
-        while await users_collection.find_one({"display_id": display_id}):
-            display_id = f"{original_display_id}{counter}"
-            counter += 1
-
-        # Tạo user mới
-        user_data = {
-            "email": email,
-            "display_id": display_id,
-            "name": name,
-            "avatar": avatar,
-            "bio": "",
-            "firebase_uid": uid,
-            "createdAt": datetime.now(timezone.utc),
-            "lastLoginAt": datetime.now(timezone.utc),
-        }
-
-        # async call
-        result = await users_collection.insert_one(user_data)
-        user = await users_collection.find_one({"_id": result.inserted_id})
+        # ✅ Unique index decides - no pre-check find_one per candidate
+        user = await _insert_user_with_unique_display_id(email, uid, name, avatar, display_id)
         
         # Khởi tạo các collections phụ cho user mới - ✅ Pass ObjectId
         await UserDataService.init_user_data(user["_id"])
@@ -218,26 +284,33 @@ async def update_me_handler(user_update: dict, decoded):
     Cập nhật thông tin cá nhân
     """
     email = extract_user_email(decoded)
-    user = await users_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
     
     # Loại bỏ các field không được phép edit
     user_update.pop("email", None)
     user_update.pop("hashed_password", None)
     user_update.pop("firebase_uid", None)
     
-    # Kiểm tra display_id trùng
+    # Current user + display_id duplicate check are independent - run concurrently
     if "display_id" in user_update:
-        existing = await users_collection.find_one({"display_id": user_update["display_id"]})
-        if existing and existing["_id"] != user["_id"]:
-            raise HTTPException(status_code=400, detail="Display ID already taken")
+        user, existing = await asyncio.gather(
+            users_collection.find_one({"email": email}, {"_id": 1}),
+            users_collection.find_one({"display_id": user_update["display_id"]}, {"_id": 1})
+        )
+    else:
+        user, existing = await users_collection.find_one({"email": email}, {"_id": 1}), None
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    # Kiểm tra display_id trùng
+    if existing and existing["_id"] != user["_id"]:
+        raise HTTPException(status_code=400, detail="Display ID already taken")
     
-    await users_collection.update_one(
+    # ✅ Write + read the updated doc in one round-trip
+    updated_user = await users_collection.find_one_and_update(
         {"_id": user["_id"]},
-        {"$set": user_update}
+        {"$set": user_update},
+        return_document=ReturnDocument.AFTER
     )
-    updated_user = await users_collection.find_one({"_id": user["_id"]})
     return user_helper(updated_user)
 
 
@@ -246,13 +319,16 @@ async def search_users_handler(q: str, decoded):
     Tìm kiếm người dùng theo display_id
     """
     email = extract_user_email(decoded)
-    current_user = await users_collection.find_one({"email": email})
+    current_user = await users_collection.find_one({"email": email}, {"_id": 1})
     
+    # ✅ Anchored prefix match on the escaped input - no full-string scan per user, no regex injection
     query = {
-        "display_id": {"$regex": q, "$options": "i"},
+        "display_id": {"$regex": f"^{re.escape(q)}", "$options": "i"},
         "_id": {"$ne": current_user["_id"]}  
     }
-    users = await users_collection.find(query).to_list(length=20)
+    users = await users_collection.find(
+        query, {"display_id": 1, "name": 1, "avatar": 1}
+    ).to_list(length=20)
     return [user_helper(u) for u in users]
 
 
@@ -263,12 +339,10 @@ async def get_my_social_handler(decoded):
     Lấy thông tin social của user hiện tại
     """
     email = extract_user_email(decoded)
-    user = await users_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = await _get_user_id_by_email(email)
     
     # ✅ Pass ObjectId directly
-    social_data = await UserDataService.get_user_social(user["_id"])
+    social_data = await UserDataService.get_user_social(user_id)
     return social_data.dict() if social_data else {
         "followers": [], "following": [], "follower_count": 0, "following_count": 0
     }
@@ -282,8 +356,11 @@ async def follow_user_handler(user_id: str, decoded):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
     email = extract_user_email(decoded)
-    user_to_follow = await users_collection.find_one({"_id": ObjectId(user_id)})
-    current_user = await users_collection.find_one({"email": email})
+    # Independent lookups - run concurrently
+    user_to_follow, current_user = await asyncio.gather(
+        users_collection.find_one({"_id": ObjectId(user_id)}, {"display_id": 1}),
+        users_collection.find_one({"email": email}, {"_id": 1})
+    )
 
     if not user_to_follow or not current_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -321,12 +398,10 @@ async def get_my_activity_handler(decoded):
     Lấy activity history của user hiện tại
     """
     email = extract_user_email(decoded)
-    user = await users_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = await _get_user_id_by_email(email)
     
     # ✅ Pass ObjectId directly
-    activity_data = await UserDataService.get_user_activity(user["_id"])
+    activity_data = await UserDataService.get_user_activity(user_id)
     return activity_data.dict() if activity_data else {
         "favorite_dishes": [], "cooked_dishes": [], "viewed_dishes": [], 
         "created_recipes": [], "created_dishes": []
@@ -338,15 +413,42 @@ async def add_cooked_dish_handler(dish_id: str, decoded):
     Thêm món vào lịch sử đã nấu
     """
     email = extract_user_email(decoded)
-    user = await users_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = await _get_user_id_by_email(email)
     
     # ✅ Pass ObjectId directly
-    result = await UserDataService.add_to_cooked(user["_id"], dish_id, MAX_HISTORY)
+    result = await UserDataService.add_to_cooked(user_id, dish_id, MAX_HISTORY)
     return result
 
 
+# dish_id -> {"name", "image_b64"} for view-history entries; a renamed dish shows up within 5 min
+# Inline base64 images are unbounded, so only entries with a small (thumbnail-sized) image are cached -
+# worst case the cache holds maxsize x DISH_META_MAX_IMAGE_CHARS (~32 MB)
+DISH_META_MAX_IMAGE_CHARS = 16 * 1024
+_dish_meta_cache = TTLCache(ttl=300, maxsize=2_000)
+
+
+async def get_dish_meta(dish_id: str):
+    """
+    Name + image of a live dish for the view history, cached per worker (None if missing or deleted)
+    """
+    meta = _dish_meta_cache.get(dish_id)
+    if meta is None:
+        meta = await dishes_collection.find_one(
+            {"_id": ObjectId(dish_id), "deleted_at": {"$exists": False}},
+            {"_id": 0, "name": 1, "image_b64": 1}
+        )
+        if meta is not None and len(meta.get("image_b64") or "") <= DISH_META_MAX_IMAGE_CHARS:
+            _dish_meta_cache.set(dish_id, meta)
+    return meta
+
+
+def invalidate_dish_meta(dish_id: str) -> None:
+    """
+    Drop a cached dish meta entry - called from the dish delete/restore paths
+    """
+    _dish_meta_cache.pop(dish_id)
+
+
 async def add_viewed_dish_handler(dish_id: str, decoded):
     """
     Thêm món vào lịch sử đã xem - ✅ Use user_activity_collection với viewed_dishes_and_users
@@ -354,12 +456,13 @@ async def add_viewed_dish_handler(dish_id: str, decoded):
     if not ObjectId.is_valid(dish_id):
         raise HTTPException(status_code=400, detail="Invalid dish ID")
     
-    dish = await dishes_collection.find_one({"_id": ObjectId(dish_id)})
+    email = extract_user_email(decoded)
+    dish, user = await asyncio.gather(
+        get_dish_meta(dish_id),
+        users_collection.find_one({"email": email}, {"_id": 1})
+    )
     if not dish:
         raise HTTPException(status_code=404, detail="Dish not found")
-    
-    email = extract_user_email(decoded)
-    user = await users_collection.find_one({"email": email})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -376,26 +479,68 @@ async def add_viewed_dish_handler(dish_id: str, decoded):
     }
     
     # ✅ Use user_activity_collection with viewed_dishes_and_users field
-    # 1) Xóa entry cũ nếu có (cùng type + id)
-    await user_activity_collection.update_one(
-        {"user_id": user_oid},
-        {"$pull": {"viewed_dishes_and_users": {"type": "dish", "id": dish_id}}},
-        upsert=True
-    )
-    
-    # 2) Thêm entry mới vào đầu list
+    # One pipeline update, two branches:
+    # - món đang ở đầu list (xem lại liên tục) -> chỉ cập nhật ts của entry đầu, thứ tự giữ nguyên
+    # - còn lại -> bỏ entry cũ (cùng type + id), thêm entry mới vào đầu, giữ tối đa 50 items
     await user_activity_collection.update_one(
         {"user_id": user_oid},
-        {
-            "$push": {
+        [{
+            "$set": {
                 "viewed_dishes_and_users": {
-                    "$each": [viewed_entry],
-                    "$position": 0,  # Thêm vào đầu
-                    "$slice": 50     # Giữ tối đa 50 items
-                }
-            },
-            "$set": {"updated_at": now}
-        },
+                    "$let": {
+                        "vars": {"history": {"$ifNull": ["$viewed_dishes_and_users", []]}},
+                        "in": {
+                            "$let": {
+                                "vars": {"head": {"$arrayElemAt": ["$$history", 0]}},
+                                "in": {
+                                    "$cond": {
+                                        "if": {
+                                            "$and": [
+                                                {"$eq": ["$$head.type", "dish"]},
+                                                {"$eq": ["$$head.id", dish_id]}
+                                            ]
+                                        },
+                                        # Fast path - touch the timestamp only
+                                        "then": {
+                                            "$concatArrays": [
+                                                [{"$mergeObjects": ["$$head", {"ts": now}]}],
+                                                {"$slice": ["$$history", 1, MAX_HISTORY]}
+                                            ]
+                                        },
+                                        "else": {
+                                            "$slice": [
+                                                {
+                                                    "$concatArrays": [
+                                                        # $literal - name/image must never be read as field paths
+                                                        {"$literal": [viewed_entry]},
+                                                        {
+                                                            "$filter": {
+                                                                "input": "$$history",
+                                                                "as": "v",
+                                                                "cond": {
+                                                                    "$not": [{
+                                                                        "$and": [
+                                                                            {"$eq": ["$$v.type", "dish"]},
+                                                                            {"$eq": ["$$v.id", dish_id]}
+                                                                        ]
+                                                                    }]
+                                                                }
+                                                            }
+                                                        }
+                                                    ]
+                                                },
+                                                MAX_HISTORY
+                                            ]
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                },
+                "updated_at": now
+            }
+        }],
         upsert=True
     )
     
@@ -408,11 +553,7 @@ async def get_viewed_dishes_handler(limit: int, decoded):
     """
     try:
         email = extract_user_email(decoded)
-        user = await users_collection.find_one({"email": email})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        user_oid = user["_id"]  # ✅ ObjectId
+        user_oid = await _get_user_id_by_email(email)  # ✅ ObjectId
         
         # ✅ Get from user_activity_collection với viewed_dishes_and_users field
         activity_doc = await user_activity_collection.find_one(
@@ -422,22 +563,35 @@ async def get_viewed_dishes_handler(limit: int, decoded):
         
         viewed_items = (activity_doc or {}).get("viewed_dishes_and_users", [])[:limit]
         
-        # ✅ Filter chỉ dishes (not users) và lấy thông tin chi tiết
+        # ✅ Filter chỉ dishes (not users) - one $in query instead of a find_one per item
+        oids = [
+            ObjectId(item["id"])
+            for item in viewed_items
+            if item.get("type") == "dish" and ObjectId.is_valid(item.get("id") or "")
+        ]
+        docs = {}
+        if oids:
+            cursor = dishes_collection.find(
+                {"_id": {"$in": oids}},
+                {"name": 1, "image_b64": 1, "image_mime": 1, "cooking_time": 1, "average_rating": 1}
+            )
+            docs = {d["_id"]: d async for d in cursor}
+        
+        # Reassemble in history order
         dish_details = []
         for item in viewed_items:
-            if item.get("type") == "dish":
-                dish_id = item.get("id")
-                if dish_id and ObjectId.is_valid(dish_id):
-                    dish = await dishes_collection.find_one({"_id": ObjectId(dish_id)})
-                    if dish:
-                        dish_details.append({
-                            "id": str(dish["_id"]),
-                            "name": dish.get("name", ""),
-                            "image_b64": dish.get("image_b64"),
-                            "image_mime": dish.get("image_mime"),
-                            "cooking_time": dish.get("cooking_time", 0),
-                            "average_rating": dish.get("average_rating", 0.0),
-                            "viewed_at": item.get("ts")  # ✅ Use 'ts' field from new format
+            if item.get("type") != "dish" or not ObjectId.is_valid(item.get("id") or ""):
+                continue
+            dish = docs.get(ObjectId(item["id"]))
+            if dish:
+                dish_details.append({
+                    "id": str(dish["_id"]),
+                    "name": dish.get("name", ""),
+                    "image_b64": dish.get("image_b64"),
+                    "image_mime": dish.get("image_mime"),
+                    "cooking_time": dish.get("cooking_time", 0),
+                    "average_rating": dish.get("average_rating", 0.0),
+                    "viewed_at": item.get("ts")  # ✅ Use 'ts' field from new format
                 })
         
         return {
@@ -452,19 +606,19 @@ async def notify_favorite_handler(dish_id: str):
     """
     Gửi thông báo khi có người thả tim món ăn 
     """
-    dish = await dishes_collection.find_one({"_id": ObjectId(dish_id)})
+    # ✅ OPTIMIZED: favorite_count is maintained on the dish by toggle_favorite - no count scan
+    dish = await dishes_collection.find_one(
+        {"_id": ObjectId(dish_id)},
+        {"name": 1, "creator_id": 1, "favorite_count": 1}
+    )
     if not dish:
         raise HTTPException(status_code=404, detail="Dish not found")
+    favorite_count = dish.get("favorite_count", 0)
     
     creator_id = dish.get("creator_id")
     if not creator_id:
         return {"msg": "No creator for this dish"}
     
-    # ✅ OPTIMIZED: Count favorites efficiently using aggregation
-    favorite_count = await user_activity_collection.count_documents({
-        "favorite_dishes": dish_id
-    })
-    
     # Gửi thông báo milestone
     if favorite_count > 0 and favorite_count % 5 == 0:
         await user_notifications_collection.update_one(
@@ -473,7 +627,7 @@ async def notify_favorite_handler(dish_id: str):
                 "$push": {"notifications": {
                     "type": "milestone",
                     "message": f"Món ăn '{dish['name']}' của bạn đã nhận được {favorite_count} lượt thả tim!",
-                    "created_at": "now",
+                    "created_at": datetime.now(timezone.utc),
                     "read": False
                 }},
                 "$inc": {"unread_count": 1}
@@ -490,12 +644,10 @@ async def get_my_notifications_handler(decoded):
     Lấy thông báo của user hiện tại
     """
     email = extract_user_email(decoded)
-    user = await users_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = await _get_user_id_by_email(email)
     
     # ✅ Pass ObjectId directly
-    notif_data = await UserDataService.get_user_notifications(user["_id"])
+    notif_data = await UserDataService.get_user_notifications(user_id)
     return notif_data.dict() if notif_data else {"notifications": [], "unread_count": 0}
 
 
@@ -504,13 +656,11 @@ async def set_reminders_handler(reminders: List[str], decoded):
     Đặt thời gian nhắc nhở
     """
     email = extract_user_email(decoded)
-    user = await users_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = await _get_user_id_by_email(email)
 
     # ✅ Use ObjectId directly
     await user_preferences_collection.update_one(
-        {"user_id": user["_id"]},
+        {"user_id": user_id},
         {"$set": {"reminders": reminders}},
         upsert=True
     )
@@ -522,23 +672,30 @@ async def get_reminders_handler(decoded):
     Lấy danh sách thời gian nhắc nhở
     """
     email = extract_user_email(decoded)
-    user = await users_collection.find_one({"email": email})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    user_id = await _get_user_id_by_email(email)
     
     # ✅ Use ObjectId directly
-    preferences = await user_preferences_collection.find_one({"user_id": user["_id"]})
+    preferences = await user_preferences_collection.find_one({"user_id": user_id})
     return preferences.get("reminders", []) if preferences else []
 
-async def get_my_favorites_handler(decoded):
+async def get_my_favorites_handler(decoded, if_none_match: Optional[str] = None):
     """
     Trả về danh sách món ăn yêu thích của user hiện tại.
+    Returns (etag, dishes) - dishes is None when if_none_match already matches (caller answers 304)
+    ETag follows users.favorites_version, bumped on every favorite/unfavorite
     """
     user_email = decoded.get("email")
-    user = await users_collection.find_one({"email": user_email})
+    user = await users_collection.find_one(
+        {"email": user_email},
+        {"favorite_dishes": 1, "favorites_version": 1}
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    etag = f'W/"{user["_id"]}-{user.get("favorites_version", 0)}"'
+    if if_none_match == etag:
+        return etag, None
+
     favorite_ids = user.get("favorite_dishes", [])
     if not isinstance(favorite_ids, list):
         favorite_ids = []
@@ -550,17 +707,21 @@ async def get_my_favorites_handler(decoded):
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid dish ID format")
 
-        cursor = dishes_collection.find({"_id": {"$in": object_ids}})
+        cursor = dishes_collection.find({"_id": {"$in": object_ids}}).batch_size(50)
         async for dish in cursor:
             dish["id"] = str(dish["_id"])
             dish["_id"] = str(dish["_id"])
             dishes.append(dish)
 
-    return dishes
+    return etag, dishes
 
 
 # ==================== ADMIN HANDLERS ====================
 
+# Max concurrent Cloudinary calls (uploads / destroys) in the bulk admin jobs
+CLOUDINARY_MAX_IN_FLIGHT = 16
+
+
 async def cleanup_dishes_handler(decoded):
     """
     Admin: Cleanup invalid dishes and migrate image fields
@@ -604,15 +765,16 @@ async def permanent_delete_old_dishes_handler(decoded):
     if not await is_admin(decoded):
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    import logging
-    
     # Calculate cutoff date (7 days ago)
     cutoff_date = datetime.now(timezone.utc) - timedelta(days=7)
     
-    # Find dishes deleted more than 7 days ago
-    old_deleted_dishes = await dishes_collection.find({
-        "deleted_at": {"$exists": True, "$lt": cutoff_date}
-    }).to_list(length=None)
+    from routes.dish_route import _DISH_CLEANUP_PROJECTION, _extract_cloudinary_public_id
+    
+    # Find dishes deleted more than 7 days ago - only the fields the cleanup needs
+    old_deleted_dishes = await dishes_collection.find(
+        {"deleted_at": {"$exists": True, "$lt": cutoff_date}},
+        _DISH_CLEANUP_PROJECTION
+    ).to_list(length=None)
     
     cleanup_stats = {
         "dishes_deleted": 0,
@@ -621,55 +783,102 @@ async def permanent_delete_old_dishes_handler(decoded):
         "recipes_deleted": 0,
         "errors": []
     }
+    if not old_deleted_dishes:
+        return {
+            "success": True,
+            "cleanup_stats": cleanup_stats,
+            "cutoff_date": cutoff_date.isoformat()
+        }
     
     # Import collections needed
     from database.mongo import recipe_collection, comments_collection
+    from routes.dish_route import _destroy_cloudinary_image, pending_cloudinary_deletes_col
+    
+    dish_oids = [dish["_id"] for dish in old_deleted_dishes]
+    dish_ids = [str(oid) for oid in dish_oids]
+    # References may be stored as string or ObjectId (same rule as _dish_refs in dish_route)
+    dish_refs = {"$in": dish_ids + dish_oids}
+    recipe_oids = [
+        ObjectId(dish["recipe_id"])
+        for dish in old_deleted_dishes
+        if dish.get("recipe_id") and ObjectId.is_valid(dish["recipe_id"])
+    ]
+    
+    # 1-3. One statement per collection instead of one per dish
+    activity_fields = ("favorite_dishes", "cooked_dishes", "viewed_dishes", "created_dishes")
+    comments_result, recipe_result, activity_result = await asyncio.gather(
+        comments_collection.delete_many({"dish_id": dish_refs}),
+        recipe_collection.delete_many({"_id": {"$in": recipe_oids}}),
+        user_activity_collection.update_many(
+            {"$or": [{field: dish_refs} for field in activity_fields]},
+            {"$pull": {field: dish_refs for field in activity_fields}}
+        ),
+        return_exceptions=True
+    )
+    cleanup_failed = False
+    for step, result in (("comments", comments_result), ("recipes", recipe_result), ("user activities", activity_result)):
+        if isinstance(result, Exception):
+            cleanup_failed = True
+            cleanup_stats["errors"].append(f"Failed to clean up {step}: {str(result)}")
+            logger.error("Error cleaning up %s for old dishes: %s", step, result)
+    if not isinstance(comments_result, Exception):
+        cleanup_stats["comments_deleted"] = comments_result.deleted_count
+    if not isinstance(recipe_result, Exception):
+        cleanup_stats["recipes_deleted"] = recipe_result.deleted_count
+    
+    # ✅ The cleanup is batched, so a failed step leaves every dish in place - the next run retries it
+    if cleanup_failed:
+        logger.info("Admin cleanup aborted before deleting dishes: %s", cleanup_stats)
+        return {
+            "success": False,
+            "cleanup_stats": cleanup_stats,
+            "cutoff_date": cutoff_date.isoformat()
+        }
     
-    for dish in old_deleted_dishes:
-        dish_id = str(dish["_id"])
+    # 4. Delete the dishes themselves
+    try:
+        dishes_result = await dishes_collection.delete_many({"_id": {"$in": dish_oids}})
+        cleanup_stats["dishes_deleted"] = dishes_result.deleted_count
+        for dish_id in dish_ids:
+            invalidate_dish_meta(dish_id)
+    except Exception as e:
+        cleanup_stats["errors"].append(f"Failed to delete dishes: {str(e)}")
+        logger.error("Error deleting old dishes: %s", e)
+        return {
+            "success": False,
+            "cleanup_stats": cleanup_stats,
+            "cutoff_date": cutoff_date.isoformat()
+        }
+    
+    # 5. Only now destroy Cloudinary images - queued durably first so the reaper
+    # (retry_pending_cloudinary_deletes) picks up anything that fails here
+    # Same public_id rule as the dish delete paths and main_async's auto cleanup
+    public_ids = [pid for pid in map(_extract_cloudinary_public_id, old_deleted_dishes) if pid]
+    if public_ids:
+        now = datetime.now(timezone.utc)
+        await pending_cloudinary_deletes_col.bulk_write([
+            UpdateOne(
+                {"public_id": pid},
+                {"$setOnInsert": {"public_id": pid, "created_at": now}},
+                upsert=True
+            )
+            for pid in public_ids
+        ], ordered=False)
         
-        try:
-            # 1. Delete Cloudinary image if exists
-            if dish.get("cloudinary_public_id"):
+        sem = asyncio.Semaphore(CLOUDINARY_MAX_IN_FLIGHT)
+        
+        async def _destroy(public_id):
+            async with sem:
                 try:
-                    import cloudinary
-                    cloudinary.uploader.destroy(dish["cloudinary_public_id"])
+                    await _destroy_cloudinary_image(public_id)
+                    await pending_cloudinary_deletes_col.delete_one({"public_id": public_id})
                     cleanup_stats["images_deleted"] += 1
                 except Exception as e:
-                    cleanup_stats["errors"].append(f"Failed to delete image for dish {dish_id}: {str(e)}")
-            
-            # 2. Delete associated comments
-            comments_result = await comments_collection.delete_many({"dish_id": dish_id})
-            cleanup_stats["comments_deleted"] += comments_result.deleted_count
-            
-            # 3. Delete associated recipe if exists
-            if dish.get("recipe_id"):
-                recipe_result = await recipe_collection.delete_one({"_id": ObjectId(dish["recipe_id"])})
-                if recipe_result.deleted_count > 0:
-                    cleanup_stats["recipes_deleted"] += 1
-            
-            # 4. Remove from user activities
-            await user_activity_collection.update_many(
-                {},
-                {
-                    "$pull": {
-                        "favorite_dishes": dish_id,
-                        "cooked_dishes": dish_id,
-                        "viewed_dishes": dish_id,
-                        "created_dishes": dish_id
-                    }
-                }
-            )
-            
-            # 5. Finally delete the dish itself
-            await dishes_collection.delete_one({"_id": dish["_id"]})
-            cleanup_stats["dishes_deleted"] += 1
-            
-        except Exception as e:
-            cleanup_stats["errors"].append(f"Failed to delete dish {dish_id}: {str(e)}")
-            logging.error(f"Error deleting dish {dish_id}: {str(e)}")
+                    cleanup_stats["errors"].append(f"Failed to delete image {public_id} (will retry later): {str(e)}")
+        
+        await asyncio.gather(*(_destroy(pid) for pid in public_ids))
     
-    logging.info(f"Admin cleanup completed: {cleanup_stats}")
+    logger.info("Admin cleanup completed: %s", cleanup_stats)
     return {
         "success": True,
         "cleanup_stats": cleanup_stats,
@@ -686,23 +895,33 @@ async def migrate_difficulty_to_dishes_handler(decoded):
     
     from database.mongo import recipe_collection
     
-    migrated_count = 0
-    
-    dishes_cursor = dishes_collection.find({
-        "recipe_id": {"$exists": True, "$ne": None},
-        "difficulty": {"$exists": False}
-    })
+    # ✅ Server-side join yields (dish _id, difficulty) pairs - no find_one per dish
+    pairs = await dishes_collection.aggregate([
+        {"$match": {
+            "recipe_id": {"$exists": True, "$ne": None},
+            "difficulty": {"$exists": False}
+        }},
+        {"$project": {
+            "_rid": {"$convert": {"input": "$recipe_id", "to": "objectId", "onError": None, "onNull": None}}
+        }},
+        {"$lookup": {
+            "from": recipe_collection.name,
+            "localField": "_rid",
+            "foreignField": "_id",
+            "pipeline": [{"$project": {"_id": 0, "difficulty": 1}}],
+            "as": "r"
+        }},
+        {"$project": {"difficulty": {"$arrayElemAt": ["$r.difficulty", 0]}}},
+        {"$match": {"difficulty": {"$nin": [None, ""]}}}
+    ], batchSize=1000).to_list(length=None)  # tiny (_id, difficulty) docs - fewer getMore round-trips
     
-    async for dish in dishes_cursor:
-        recipe_id = dish.get("recipe_id")
-        if recipe_id and ObjectId.is_valid(recipe_id):
-            recipe = await recipe_collection.find_one({"_id": ObjectId(recipe_id)})
-            if recipe and recipe.get("difficulty"):
-                await dishes_collection.update_one(
-                    {"_id": dish["_id"]},
-                    {"$set": {"difficulty": recipe["difficulty"]}}
-                )
-                migrated_count += 1
+    migrated_count = 0
+    if pairs:
+        result = await dishes_collection.bulk_write(
+            [UpdateOne({"_id": p["_id"]}, {"$set": {"difficulty": p["difficulty"]}}) for p in pairs],
+            ordered=False
+        )
+        migrated_count = result.modified_count
     
     return {
         "migrated_count": migrated_count,
@@ -710,6 +929,55 @@ async def migrate_difficulty_to_dishes_handler(decoded):
     }
 
 
+async def _migrate_collection_images(collection, folder: str) -> int:
+    """
+    Upload every base64 image in a collection to Cloudinary, up to CLOUDINARY_MAX_IN_FLIGHT at once
+    The semaphore is taken before a doc is scheduled, so at most that many decoded images are in memory
+    """
+    import base64
+    from routes.dish_route import _cloudinary_upload
+    
+    sem = asyncio.Semaphore(CLOUDINARY_MAX_IN_FLIGHT)
+    pending = set()
+    migrated = 0
+    
+    async def _migrate_one(doc):
+        nonlocal migrated
+        try:
+            image_data = base64.b64decode(doc["image_b64"])
+            # Async REST upload - does not block the event loop
+            upload_result = await _cloudinary_upload(image_data, folder)
+            await collection.update_one(
+                {"_id": doc["_id"]},
+                {
+                    "$set": {
+                        "image_url": upload_result["secure_url"],
+                        "cloudinary_public_id": upload_result["public_id"]
+                    },
+                    "$unset": {"image_b64": "", "image_mime": ""}
+                }
+            )
+            migrated += 1
+        except Exception as e:
+            logger.error("Failed to migrate %s image %s: %s", folder, doc["_id"], e)
+        finally:
+            sem.release()
+    
+    # Base64 docs are large and consumed CLOUDINARY_MAX_IN_FLIGHT at a time - keep batches moderate
+    cursor = collection.find(
+        {"image_b64": {"$exists": True, "$nin": [None, ""]}}, {"image_b64": 1}
+    ).batch_size(64)
+    async for doc in cursor:
+        await sem.acquire()
+        task = asyncio.create_task(_migrate_one(doc))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    
+    if pending:
+        await asyncio.gather(*pending)
+    return migrated
+
+
 async def migrate_existing_images_handler(decoded):
     """
     Admin: Migrate existing base64 images to Cloudinary
@@ -717,70 +985,10 @@ async def migrate_existing_images_handler(decoded):
     if not await is_admin(decoded):
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    import base64
-    import cloudinary
     from database.mongo import recipe_collection
     
-    migrated_dishes = 0
-    migrated_recipes = 0
-    
-    # Migrate dishes
-    dishes_cursor = dishes_collection.find({"image_b64": {"$exists": True, "$ne": None}})
-    async for dish in dishes_cursor:
-        try:
-            image_b64 = dish.get("image_b64")
-            image_mime = dish.get("image_mime", "image/jpeg")
-            
-            if image_b64:
-                image_data = base64.b64decode(image_b64)
-                upload_result = cloudinary.uploader.upload(
-                    image_data,
-                    folder="dishes",
-                    resource_type="image"
-                )
-                
-                await dishes_collection.update_one(
-                    {"_id": dish["_id"]},
-                    {
-                        "$set": {
-                            "image_url": upload_result["secure_url"],
-                            "cloudinary_public_id": upload_result["public_id"]
-                        },
-                        "$unset": {"image_b64": "", "image_mime": ""}
-                    }
-                )
-                migrated_dishes += 1
-        except Exception as e:
-            print(f"Failed to migrate dish image: {str(e)}")
-    
-    # Migrate recipes
-    recipes_cursor = recipe_collection.find({"image_b64": {"$exists": True, "$ne": None}})
-    async for recipe in recipes_cursor:
-        try:
-            image_b64 = recipe.get("image_b64")
-            image_mime = recipe.get("image_mime", "image/jpeg")
-            
-            if image_b64:
-                image_data = base64.b64decode(image_b64)
-                upload_result = cloudinary.uploader.upload(
-                    image_data,
-                    folder="recipes",
-                    resource_type="image"
-                )
-                
-                await recipe_collection.update_one(
-                    {"_id": recipe["_id"]},
-                    {
-                        "$set": {
-                            "image_url": upload_result["secure_url"],
-                            "cloudinary_public_id": upload_result["public_id"]
-                        },
-                        "$unset": {"image_b64": "", "image_mime": ""}
-                    }
-                )
-                migrated_recipes += 1
-        except Exception as e:
-            print(f"Failed to migrate recipe image: {str(e)}")
+    migrated_dishes = await _migrate_collection_images(dishes_collection, "dishes")
+    migrated_recipes = await _migrate_collection_images(recipe_collection, "recipes")
     
     return {
         "migrated_dishes": migrated_dishes,